@@ -272,3 +272,10 @@ SOCIALACCOUNT_ADAPTER = "keymetrics.users.adapters.SocialAccountAdapter"
 
 # Your stuff...
 # ------------------------------------------------------------------------------
+# Directory of the on-disk cache of raw SEC API responses, disabled when blank
+SEC_RESPONSE_CACHE_DIR = env("SEC_RESPONSE_CACHE_DIR", default="")
+SEC_RESPONSE_CACHE_MAX_BYTES = env.int(
+    "SEC_RESPONSE_CACHE_MAX_BYTES", default=5 * 1024 * 1024 * 1024
+)
+# Redis shared by every ingestion process for the SEC rate limit, in-process when blank
+SEC_RATE_LIMIT_REDIS_URL = env("SEC_RATE_LIMIT_REDIS_URL", default="")
@@ -62,6 +62,9 @@ INSTALLED_APPS += ["django_extensions"]  # noqa F405
 
 # Your stuff...
 # ------------------------------------------------------------------------------
+SEC_RESPONSE_CACHE_DIR = env(
+    "SEC_RESPONSE_CACHE_DIR", default=str(ROOT_DIR / ".sec_cache")  # noqa F405
+)
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
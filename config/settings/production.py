@@ -28,6 +28,8 @@ CACHES = {
         },
     }
 }
+# SEC requests of every ingestion process share one rate limit in the cache Redis
+SEC_RATE_LIMIT_REDIS_URL = env("REDIS_URL")
 
 # SECURITY
 # ------------------------------------------------------------------------------
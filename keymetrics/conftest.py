@@ -1,5 +1,6 @@
 import pytest
 
+from keymetrics.financials.management.commands._periods import period_registry
 from keymetrics.financials.tests.factories import (
     CompanyFactory,
     FilingFactory,
@@ -46,6 +47,12 @@ def no_requests(monkeypatch):
     monkeypatch.delattr("requests.sessions.Session.request")
 
 
+@pytest.fixture(autouse=True)
+def clear_period_registry():
+    """Forget Time Dimension ids cached by the process-wide registry between tests."""
+    period_registry.clear()
+
+
 @pytest.fixture(autouse=True)
 def whitenoise_autorefresh(settings):
     """
@@ -70,7 +70,33 @@ class FilingAdmin(admin.ModelAdmin):
 class ChecksumAdmin(admin.ModelAdmin):
     list_filter = ("api_type",)
     search_fields = ["company__name"]
-    readonly_fields = ["company", "api_type", "checksum"]
+    readonly_fields = ["company", "api_type", "checksum", "etag", "last_modified"]
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request).select_related("company")
+        return queryset
+
+
+class IngestionRunCompanyInline(admin.TabularInline):
+    model = m.IngestionRunCompany
+    readonly_fields = ["company", "status", "attempts", "seconds", "error"]
+    extra = 0
+
+
+@admin.register(m.IngestionRun)
+class IngestionRunAdmin(admin.ModelAdmin):
+    list_display = ("__str__", "status", "finished_at")
+    list_filter = ("api_type", "status")
+    readonly_fields = ["api_type", "status", "started_at", "finished_at"]
+    inlines = [IngestionRunCompanyInline]
+
+
+@admin.register(m.IngestionJob)
+class IngestionJobAdmin(admin.ModelAdmin):
+    list_display = ("__str__", "status", "attempts", "available_at", "locked_by")
+    list_filter = ("api_type", "status")
+    search_fields = ["company__name"]
+    readonly_fields = ["company", "api_type", "locked_by", "locked_at", "error"]
 
     def get_queryset(self, request):
         queryset = super().get_queryset(request).select_related("company")
@@ -0,0 +1,136 @@
+import json
+import logging
+import re
+import threading
+import zipfile
+from typing import Callable, Optional
+
+from django.db import transaction
+
+from keymetrics.financials.models import Checksum
+
+from ._concurrent import map_concurrently
+from ._lookup_cache import LookupCache
+
+logger = logging.getLogger(__name__)
+
+CIK_MEMBER_PATTERN = re.compile(r"^CIK(\d{10})\.json$")
+
+
+class BulkArchive:
+    """
+    Read access to the SEC nightly bulk archives (companyfacts.zip, submissions.zip).
+    Members are decompressed straight from the zip file, never extracted to disk.
+    Each thread gets its own handle on the archive so members can be read in parallel.
+    The handles are closed by close(), or on leaving the archive's with block.
+
+    :param path: Local path of the zip archive
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._handles: list[zipfile.ZipFile] = []
+        self._handles_lock = threading.Lock()
+        with zipfile.ZipFile(path) as archive:
+            self.names = archive.namelist()
+
+    def __enter__(self) -> "BulkArchive":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def _archive(self) -> zipfile.ZipFile:
+        if not hasattr(self._local, "archive"):
+            self._local.archive = zipfile.ZipFile(self.path)
+            with self._handles_lock:
+                self._handles.append(self._local.archive)
+        return self._local.archive
+
+    def close(self):
+        """
+        Closes the archive handles opened by every thread
+        """
+        with self._handles_lock:
+            for handle in self._handles:
+                handle.close()
+            self._handles = []
+        self._local = threading.local()
+
+    def company_members(self, ciks: Optional[set[int]] = None) -> list[str]:
+        """
+        Names of the per company members (CIK##########.json), excluding the
+        overflow submissions files
+
+        :param ciks: Only return members for these CIK's
+        :return: List of member names
+        """
+        members = []
+        for name in self.names:
+            match = CIK_MEMBER_PATTERN.match(name)
+            if match and (ciks is None or int(match.group(1)) in ciks):
+                members.append(name)
+        return members
+
+    def read(self, name: str) -> Optional[dict]:
+        """
+        Reads an archive member in the same format as get_sec_data
+
+        :param name: Archive member name
+        :return: Dictionary of member data (JSON) and MD5 checksum of the JSON content
+            or None if the member does not exist
+        """
+        try:
+            content = self._archive.read(name)
+        except KeyError:
+            return None
+        return {"data": json.loads(content), "checksum": Checksum.generate_md5(content)}
+
+
+def save_members(
+    archive: BulkArchive,
+    members: list[str],
+    save: Callable[[dict], None],
+    workers: int = 1,
+    cache: Optional[LookupCache] = None,
+) -> list[str]:
+    """
+    Reads archive members on worker threads and saves each on the calling thread in
+    its own transaction, so a member's checksum is only committed with its data.
+    Members that cannot be read or saved are logged and skipped instead of stopping
+    the load.
+
+    :param archive: Open BulkArchive
+    :param members: Names of the members to save
+    :param save: Function saving a member in the format of get_sec_data
+    :param workers: Number of threads reading archive members
+    :param cache: Lookup cache used by save, reloaded after a failed save because
+        the ids it added within the rolled back transaction are gone
+    :return: Names of the members that failed
+    """
+
+    def read(name: str) -> Optional[dict]:
+        try:
+            return archive.read(name)
+        except (ValueError, zipfile.BadZipFile):
+            logger.exception(f"Archive member {name} could not be read")
+            return None
+
+    failed = []
+    for name, resp in map_concurrently(read, members, workers=workers):
+        if resp is None:
+            failed.append(name)
+            continue
+        try:
+            with transaction.atomic():
+                save(resp)
+        except Exception:
+            logger.exception(f"Saving archive member {name} failed")
+            failed.append(name)
+            if cache is not None:
+                cache.reload()
+    if failed:
+        logger.error(f"{len(failed)} archive members failed: {', '.join(failed)}")
+    return failed
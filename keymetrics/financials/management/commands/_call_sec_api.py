@@ -1,31 +1,229 @@
+import hashlib
+import json
 import logging
+import random
+import tempfile
+import threading
+import time
+from email.utils import parsedate_to_datetime
 from typing import Optional
 
 import requests
-from pyrate_limiter import Duration, Limiter, RequestRate
+from requests.adapters import HTTPAdapter
 
 from config.settings.base import env
 from keymetrics.financials.models import Checksum
 
-limiter = Limiter(RequestRate(10, Duration.SECOND))
+from ._rate_limit import get_rate_limiter
+from ._response_cache import get_response_cache
 
+STREAM_CHUNK_SIZE = 65536
 
-@limiter.ratelimit("SEC", delay=True)
-def get_sec_data(url: str) -> Optional[dict]:
+# Transient responses worth retrying, 429 and 503 also mean the SEC is throttling us
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+THROTTLE_STATUSES = {429, 503}
+MAX_ATTEMPTS = env.int("SEC_API_MAX_ATTEMPTS", default=5)
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = env.float("SEC_API_READ_TIMEOUT", default=3)
+# companyfacts payloads of large filers take much longer to generate and send
+LARGE_READ_TIMEOUT = env.float("SEC_API_LARGE_READ_TIMEOUT", default=20)
+MAX_READ_TIMEOUT = 120
+
+POOL_SIZE = env.int("SEC_API_POOL_SIZE", default=10)
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def create_session(pool_size: int = POOL_SIZE) -> requests.Session:
+    """
+    Creates a keep-alive session for the SEC API. Connections are pooled per host and
+    reused by every worker thread, so only the first request to a host pays for the
+    TCP/TLS handshake.
+
+    :param pool_size: Maximum number of pooled connections per host
+    :return: Session object
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=pool_size, pool_block=True)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(
+        {
+            "User-Agent": env("SEC_API_USER_AGENT"),
+            "Accept-Encoding": "gzip, deflate",
+        }
+    )
+    return session
+
+
+def get_session() -> requests.Session:
+    """
+    :return: Module level session shared by all SEC API calls, created on first use
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+
+def set_session(session: Optional[requests.Session]):
+    """
+    Replaces the shared session, e.g. with a stand-in transport for tests or benchmarks.
+    Any object with a requests compatible get method can be used. None resets it.
+
+    :param session: Session object
+    """
+    global _session
+    with _session_lock:
+        _session = session
+
+
+NOT_MODIFIED = {"not_modified": True}
+
+
+def request_headers(validators: Optional[dict] = None) -> dict:
+    """
+    Headers for an SEC API request in addition to the session headers, conditional if
+    validators from a previous response are given
+
+    :param validators: Dictionary of the "etag" and "last_modified" of a previous response
+    :return: Dictionary of request headers
+    """
+    headers = {}
+    if validators:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+
+def response_validators(r: requests.Response) -> dict:
+    """
+    :param r: Response from the SEC API
+    :return: Dictionary of the response "etag" and "last_modified" headers
+    """
+    return {
+        "etag": r.headers.get("ETag", ""),
+        "last_modified": r.headers.get("Last-Modified", ""),
+    }
+
+
+def request_timeout(url: str, attempt: int = 0) -> tuple[float, float]:
+    """
+    :param url: URL of SEC API
+    :param attempt: Number of previous attempts, the read timeout doubles each retry
+    :return: Tuple of the connect and read timeouts
+    """
+    read_timeout = LARGE_READ_TIMEOUT if "/companyfacts/" in url else READ_TIMEOUT
+    return CONNECT_TIMEOUT, min(read_timeout * 2**attempt, MAX_READ_TIMEOUT)
+
+
+def retry_after(r: requests.Response) -> Optional[float]:
+    """
+    :param r: Response from the SEC API
+    :return: Seconds to wait from the Retry-After header (seconds or HTTP date), or None
+    """
+    value = r.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, minimum: Optional[float] = None) -> float:
+    """
+    Exponential backoff with full jitter, so retrying workers do not hit the SEC in step
+
+    :param attempt: Number of previous attempts
+    :param minimum: Delay required by the server (Retry-After)
+    :return: Seconds to wait before the next attempt
+    """
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt))
+    if minimum is not None:
+        delay = max(delay, minimum)
+    return delay
+
+
+def request_sec_api(
+    url: str, headers: Optional[dict] = None, stream: bool = False
+) -> requests.Response:
+    """
+    Calls the SEC API under the shared rate limit. Connection errors, timeouts and
+    transient statuses are retried with backoff, honoring Retry-After. When the SEC
+    throttles us every request sharing the rate limit is held back too.
+
+    :param url: URL of SEC API
+    :param headers: Request headers in addition to the session headers
+    :param stream: Do not download the response content immediately
+    :return: Response of the last attempt, raises the error of the last attempt if it
+        did not get a response
+    """
+    for attempt in range(MAX_ATTEMPTS):
+        get_rate_limiter().acquire()
+        last_attempt = attempt + 1 >= MAX_ATTEMPTS
+        try:
+            r = get_session().get(
+                url,
+                headers=headers,
+                timeout=request_timeout(url, attempt),
+                stream=stream,
+            )
+        except (
+            requests.exceptions.ConnectionError,
+            requests.exceptions.Timeout,
+        ) as err:
+            if last_attempt:
+                raise
+            delay = backoff_delay(attempt)
+            logging.warning(f"{url} failed ({err}), retrying in {delay:.1f}s")
+        else:
+            if r.status_code not in RETRY_STATUSES or last_attempt:
+                return r
+            delay = backoff_delay(attempt, retry_after(r))
+            if r.status_code in THROTTLE_STATUSES:
+                get_rate_limiter().throttle(delay)
+            r.close()
+            logging.warning(f"{url} returned {r.status_code}, retrying in {delay:.1f}s")
+        time.sleep(delay)
+    raise ValueError("MAX_ATTEMPTS must be at least 1")
+
+
+def get_sec_data(url: str, validators: Optional[dict] = None) -> Optional[dict]:
     """
     Get SEC API data and checksum given a URL
 
     :param url: URL of SEC API
-    :return: Dictionary of response data (JSON) and MD5 checksum of the JSON content
+    :param validators: ETag/Last-Modified of the previous response to make the request
+        conditional
+    :return: Dictionary of response data (JSON), MD5 checksum of the JSON content and the
+        response ETag/Last-Modified, or NOT_MODIFIED if the data has not changed, or
+        None if the request still failed after retrying
     """
 
     try:
-        headers = {"User-Agent": env("SEC_API_USER_AGENT")}
-        r = requests.get(url, headers=headers, timeout=3)
+        r = request_sec_api(url, headers=request_headers(validators))
+        if r.status_code == requests.codes.not_modified:
+            return NOT_MODIFIED
         r.raise_for_status()
         data = r.json()
         checksum = Checksum.generate_md5(r.content)
-        return {"data": data, "checksum": checksum}
+        cache = get_response_cache()
+        if cache:
+            cache.put(url, checksum, r.content)
+        return {"data": data, "checksum": checksum, **response_validators(r)}
     except requests.exceptions.HTTPError as errh:
         logging.critical(errh, exc_info=True)
     except requests.exceptions.ConnectionError as errc:
@@ -35,3 +233,91 @@ def get_sec_data(url: str) -> Optional[dict]:
     except requests.exceptions.RequestException as err:
         logging.critical(err, exc_info=True)
     return None
+
+
+def download_sec_data(url: str, validators: Optional[dict] = None) -> Optional[dict]:
+    """
+    Stream SEC API data to a temporary file without loading it into memory
+
+    :param url: URL of SEC API
+    :param validators: ETag/Last-Modified of the previous response to make the request
+        conditional
+    :return: Dictionary of the temporary file (positioned at the start) holding the
+        response content (JSON), MD5 checksum of the JSON content and the response
+        ETag/Last-Modified, or NOT_MODIFIED if the data has not changed, or None if the
+        request still failed after retrying
+    """
+
+    # The file is anonymous, closing it on any failure also removes it from disk
+    file = tempfile.TemporaryFile()
+    returned = False
+    try:
+        headers = request_headers(validators)
+        with request_sec_api(url, headers=headers, stream=True) as r:
+            if r.status_code == requests.codes.not_modified:
+                return NOT_MODIFIED
+            r.raise_for_status()
+            md5 = hashlib.md5()
+            for chunk in r.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                md5.update(chunk)
+                file.write(chunk)
+            validators = response_validators(r)
+        checksum = md5.hexdigest()
+        cache = get_response_cache()
+        if cache:
+            file.seek(0)
+            cache.put_file(url, checksum, file)
+        file.seek(0)
+        returned = True
+        return {"file": file, "checksum": checksum, **validators}
+    except requests.exceptions.RequestException as err:
+        logging.critical(err, exc_info=True)
+    finally:
+        if not returned:
+            file.close()
+    return None
+
+
+def replay_sec_data(url: str, validators: Optional[dict] = None) -> Optional[dict]:
+    """
+    Get SEC API data from the response cache instead of the SEC API, same return
+    format as get_sec_data
+
+    :param url: URL of SEC API
+    :param validators: Ignored, accepted for compatibility with get_sec_data
+    :return: Dictionary of cached data (JSON) and MD5 checksum of the JSON content, or
+        None if the URL is not cached
+    """
+    cached = _cached_response(url)
+    if cached is None:
+        return None
+    path, checksum = cached
+    return {"data": json.loads(path.read_bytes()), "checksum": checksum}
+
+
+def replay_sec_file(url: str, validators: Optional[dict] = None) -> Optional[dict]:
+    """
+    Open SEC API data from the response cache instead of the SEC API, same return
+    format as download_sec_data
+
+    :param url: URL of SEC API
+    :param validators: Ignored, accepted for compatibility with download_sec_data
+    :return: Dictionary of the open cached file and MD5 checksum of the JSON content, or
+        None if the URL is not cached
+    """
+    cached = _cached_response(url)
+    if cached is None:
+        return None
+    path, checksum = cached
+    return {"file": path.open("rb"), "checksum": checksum}
+
+
+def _cached_response(url: str):
+    cache = get_response_cache()
+    if cache is None:
+        logging.critical("Replay requires SEC_RESPONSE_CACHE_DIR to be set")
+        return None
+    cached = cache.get_path(url)
+    if cached is None:
+        logging.error(f"{url} is not in the response cache")
+    return cached
@@ -1,28 +1,78 @@
+from typing import Iterable, Optional
+
+from django.utils import timezone
+
 from keymetrics.financials.models import Checksum, Company
 
 
-def checksum_checker(current_checksum: str, company: Company, api_type: str) -> bool:
+def checksum_checker(
+    current_checksum: str,
+    company: Company,
+    api_type: str,
+    etag: str = "",
+    last_modified: str = "",
+) -> bool:
     """
     Function to check the checksum of current API call against the stored checksum (if it exists)
 
     :param current_checksum: MD5 Checksum of from the current API call
     :param company: Company of the API call
     :param api_type: Either Fact or Submission (F or S) SEC API type
+    :param etag: ETag header of the current API call, stored for conditional requests
+    :param last_modified: Last-Modified header of the current API call
     :return: True if current checksum matches stored checksum, False if not
     """
 
+    checksum_qry: Optional[Checksum]
     try:
         checksum_qry = Checksum.objects.get(company=company, api_type=api_type)
-        stored_checksum = checksum_qry.checksum
     except Checksum.DoesNotExist:
-        stored_checksum = ""
+        checksum_qry = None
 
-    if current_checksum == stored_checksum:
+    if checksum_qry is not None and current_checksum == checksum_qry.checksum:
+        checksum_qry.etag = etag
+        checksum_qry.last_modified = last_modified
+        checksum_qry.checked_at = timezone.now()
+        checksum_qry.save(update_fields=["etag", "last_modified", "checked_at"])
         return True
     else:
         Checksum.objects.update_or_create(
             company=company,
             api_type=api_type,
-            defaults={"checksum": current_checksum},
+            defaults={
+                "checksum": current_checksum,
+                "etag": etag,
+                "last_modified": last_modified,
+                "checked_at": timezone.now(),
+            },
         )
         return False
+
+
+def mark_checked(company: Company, api_type: str):
+    """
+    Records a response that was not modified, the stored checksum is still current
+
+    :param company: Company of the API call
+    :param api_type: Either Fact or Submission (F or S) SEC API type
+    """
+    Checksum.objects.filter(company=company, api_type=api_type).update(
+        checked_at=timezone.now()
+    )
+
+
+def get_validators(companies: Iterable[Company], api_type: str) -> dict[int, dict]:
+    """
+    Loads the stored ETag/Last-Modified of the last API call for each Company
+
+    :param companies: Companies of the API calls
+    :param api_type: Either Fact or Submission (F or S) SEC API type
+    :return: Dictionary of Company id to "etag" and "last_modified" dictionary
+    """
+    checksums = Checksum.objects.filter(
+        company__in=companies, api_type=api_type
+    ).values("company_id", "etag", "last_modified")
+    return {
+        c["company_id"]: {"etag": c["etag"], "last_modified": c["last_modified"]}
+        for c in checksums
+    }
@@ -0,0 +1,71 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+from typing import Callable, Iterable, Iterator, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def map_concurrently(
+    func: Callable[[T], R], items: Iterable[T], workers: int = 1
+) -> Iterator[Tuple[T, R]]:
+    """
+    Calls func for every item on a thread pool and yields (item, result) pairs as the
+    calls complete, so the caller can write results to the DB while other downloads
+    are still in flight. At most 2 * workers results are in flight or waiting to be
+    consumed at any time. With a single worker items are processed serially in order.
+
+    :param func: Function to call for each item (e.g. get_sec_data)
+    :param items: Items to call func with (e.g. SEC API URL's)
+    :param workers: Number of worker threads
+    :return: Iterator of (item, result) tuples in order of completion
+    """
+    if workers <= 1:
+        for item in items:
+            yield item, func(item)
+        return
+
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {
+            executor.submit(func, item): item for item in islice(items, workers * 2)
+        }
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                for next_item in islice(items, 1):
+                    pending[executor.submit(func, next_item)] = next_item
+                yield item, future.result()
+
+
+def map_with_retry_list(
+    func: Callable[[T], Optional[R]],
+    items: Iterable[T],
+    workers: int = 1,
+    failed: Optional[list[T]] = None,
+) -> Iterator[Tuple[T, R]]:
+    """
+    map_concurrently for calls returning None on failure (e.g. get_sec_data). Failed
+    items are put on a retry list and called again once every other item is done, so
+    a transient failure does not cost the item its place in the run. Items that fail
+    again are skipped and appended to failed.
+
+    :param func: Function to call for each item
+    :param items: Items to call func with
+    :param workers: Number of worker threads
+    :param failed: List the items that still fail after the retry are appended to
+    :return: Iterator of (item, result) tuples of the successful calls
+    """
+    retry_list = []
+    for item, result in map_concurrently(func, items, workers=workers):
+        if result is None:
+            retry_list.append(item)
+        else:
+            yield item, result
+    for item, result in map_concurrently(func, retry_list, workers=workers):
+        if result is None:
+            if failed is not None:
+                failed.append(item)
+        else:
+            yield item, result
@@ -0,0 +1,135 @@
+import json
+import logging
+import signal
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import NamedTuple, Optional
+
+from keymetrics.financials.models import Checksum
+
+from . import load_financial_facts, load_submissions
+from ._ingestion_run import prune_finished_runs
+from ._lookup_cache import LookupCache
+from ._writers import WRITER_ORM
+
+logger = logging.getLogger(__name__)
+
+
+class CycleTiming(NamedTuple):
+    started_at: str
+    api_type: str
+    seconds: float
+    failed: int
+
+
+class IngestionDaemon:
+    """
+    Refreshes the tracked Companies on a schedule from a single resident process.
+    The lookup cache (concepts, filings, Company by CIK), the period registry, the
+    SEC API session and the rate limiter stay warm across cycles, only rows created
+    since the last cycle are loaded, so after the first cycle the cost of a cycle is
+    the conditional requests plus the new data. The cache is only reloaded when rows
+    were deleted by other processes, e.g. by delete_financial_facts. Only the latest
+    finished ingestion run of each SEC API is kept.
+
+    :param api_types: SEC APIs refreshed each cycle, in order
+    :param interval: Seconds between the start of consecutive cycles
+    :param workers: Number of threads downloading SEC data
+    :param writer: Writer of the new rows, WRITER_ORM or WRITER_COPY
+    :param status_file: JSON file the recent cycle timings are written to
+    :param history: Number of cycle timings kept
+    """
+
+    def __init__(
+        self,
+        api_types: list[str],
+        interval: float = 900.0,
+        workers: int = 1,
+        writer: str = WRITER_ORM,
+        status_file: Optional[str] = None,
+        history: int = 100,
+    ):
+        self.api_types = api_types
+        self.interval = interval
+        self.workers = workers
+        self.writer = writer
+        self.status_file = status_file
+        self.timings: deque[CycleTiming] = deque(maxlen=history)
+        self.cache: Optional[LookupCache] = None
+        self._stopping = False
+
+    def stop(self, *args):
+        """
+        Finishes the current cycle and exits, installed as SIGTERM/SIGINT handler
+        """
+        logger.info("Ingestion daemon stopping after the current cycle")
+        self._stopping = True
+
+    def run_cycle(self) -> list[CycleTiming]:
+        """
+        Refreshes every SEC API once
+
+        :return: Timings of the cycle, one per SEC API
+        """
+        if self.cache is None:
+            self.cache = LookupCache()
+        else:
+            self.cache.refresh()
+        timings = []
+        for api_type in self.api_types:
+            started_at = datetime.now(timezone.utc).isoformat()
+            start = time.monotonic()
+            if api_type == Checksum.TYPE_FACTS:
+                failed = load_financial_facts.fetch_sec_data(
+                    workers=self.workers, writer=self.writer, cache=self.cache
+                )
+            else:
+                failed = load_submissions.fetch_sec_data(
+                    workers=self.workers, writer=self.writer, cache=self.cache
+                )
+            prune_finished_runs(api_type)
+            timing = CycleTiming(
+                started_at=started_at,
+                api_type=api_type,
+                seconds=round(time.monotonic() - start, 3),
+                failed=len(failed),
+            )
+            logger.info(
+                f"Ingestion cycle {api_type} took {timing.seconds}s, "
+                f"{timing.failed} companies failed"
+            )
+            timings.append(timing)
+        self.timings.extend(timings)
+        self.write_status()
+        return timings
+
+    def write_status(self):
+        """
+        Writes the recent cycle timings to the status file, if one is set
+        """
+        if not self.status_file:
+            return
+        with open(self.status_file, "w") as f:
+            json.dump([t._asdict() for t in self.timings], f, indent=2)
+
+    def run(self, cycles: Optional[int] = None):
+        """
+        Runs cycles every interval seconds until stopped
+
+        :param cycles: Number of cycles to run, forever if None
+        """
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        done = 0
+        while not self._stopping and (cycles is None or done < cycles):
+            start = time.monotonic()
+            self.run_cycle()
+            done += 1
+            if cycles is not None and done >= cycles:
+                break
+            remaining = self.interval - (time.monotonic() - start)
+            # Sleep in short steps so a stop signal is handled promptly
+            while remaining > 0 and not self._stopping:
+                time.sleep(min(remaining, 1.0))
+                remaining = self.interval - (time.monotonic() - start)
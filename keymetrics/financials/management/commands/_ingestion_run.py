@@ -0,0 +1,196 @@
+import logging
+import time
+from typing import Callable, Optional
+
+from django.db import transaction
+from django.db.models import F, QuerySet
+from django.utils import timezone
+
+from keymetrics.financials.models import Company, IngestionRun, IngestionRunCompany
+
+from ._checksum_checker import mark_checked
+from ._concurrent import map_with_retry_list
+from ._lookup_cache import LookupCache
+from ._rate_limit import log_requests_per_minute
+
+logger = logging.getLogger(__name__)
+
+
+class RunTracker:
+    """
+    Records the progress of each Company of an IngestionRun: status, attempts, time
+    taken and the error of failed Companies (the dead-letter list).
+
+    :param run: IngestionRun model object
+    """
+
+    def __init__(self, run: IngestionRun):
+        self.run = run
+        self._started: dict[int, float] = {}
+
+    @classmethod
+    def start(
+        cls,
+        api_type: str,
+        resume: bool = False,
+        retry_failed: bool = False,
+        run_id: Optional[int] = None,
+    ) -> Optional["RunTracker"]:
+        """
+        Starts a new run of all tracked Companies or continues an existing one
+
+        :param api_type: Checksum.TYPE_FACTS or Checksum.TYPE_SUBMISSIONS
+        :param resume: Continue the latest unfinished run, skipping the Companies it
+            already processed
+        :param retry_failed: Reopen the latest run and process only its failed
+            Companies (the dead-letter list)
+        :param run_id: Continue this run, e.g. in a worker process of a sharded run
+        :return: RunTracker of the run, or None if retry_failed found no failed Company
+        """
+        if run_id is not None:
+            return cls(IngestionRun.objects.get(id=run_id))
+        runs = IngestionRun.objects.filter(api_type=api_type).order_by("-started_at")
+        if retry_failed:
+            run = runs.first()
+            failed = IngestionRunCompany.STATUS_FAILED
+            if run is None or not run.companies.filter(status=failed).exists():
+                return None
+            run.companies.filter(status=IngestionRunCompany.STATUS_FAILED).update(
+                status=IngestionRunCompany.STATUS_PENDING
+            )
+            run.status = IngestionRun.STATUS_RUNNING
+            run.finished_at = None
+            run.save()
+            return cls(run)
+        if resume:
+            run = runs.filter(status=IngestionRun.STATUS_RUNNING).first()
+            if run is not None:
+                return cls(run)
+        run = IngestionRun.objects.create(api_type=api_type)
+        IngestionRunCompany.objects.bulk_create(
+            IngestionRunCompany(run=run, company=company)
+            for company in Company.objects.filter(istracked=True)
+        )
+        return cls(run)
+
+    def companies(self) -> QuerySet:
+        """
+        :return: Companies of the run that have not been processed yet
+        """
+        return Company.objects.filter(
+            ingestion_runs__run=self.run,
+            ingestion_runs__status=IngestionRunCompany.STATUS_PENDING,
+        )
+
+    def started(self, company: Company):
+        """
+        Marks the start of a Company's fetch, may be called from worker threads
+        """
+        self._started[company.id] = time.monotonic()
+
+    def _update(self, company: Company, **fields):
+        start = self._started.pop(company.id, None)
+        seconds = None if start is None else time.monotonic() - start
+        IngestionRunCompany.objects.filter(run=self.run, company=company).update(
+            attempts=F("attempts") + 1, seconds=seconds, **fields
+        )
+
+    def done(self, company: Company):
+        """
+        Records a Company whose data was saved
+        """
+        self._update(company, status=IngestionRunCompany.STATUS_DONE, error="")
+
+    def failed(self, company: Company, error: str):
+        """
+        Records a Company that failed, it stays on the dead-letter list until retried
+
+        :param error: Description of the failure
+        """
+        self._update(company, status=IngestionRunCompany.STATUS_FAILED, error=error)
+
+    def finish(self):
+        """
+        Marks the run as finished once no Company is left pending
+        """
+        if not self.companies().exists():
+            self.run.status = IngestionRun.STATUS_FINISHED
+            self.run.finished_at = timezone.now()
+            self.run.save()
+
+
+def prune_finished_runs(api_type: str, keep: int = 1) -> int:
+    """
+    Deletes the finished runs of an SEC API, and their Company rows, except the
+    latest ones, e.g. the run of every daemon cycle. The failed Companies of the
+    latest run can still be retried.
+
+    :param api_type: Checksum.TYPE_FACTS or Checksum.TYPE_SUBMISSIONS
+    :param keep: Number of the latest finished runs kept
+    :return: Number of runs deleted
+    """
+    old = IngestionRun.objects.filter(
+        api_type=api_type, status=IngestionRun.STATUS_FINISHED
+    ).order_by("-started_at", "-id")[keep:]
+    old_ids = list(old.values_list("id", flat=True))
+    if not old_ids:
+        return 0
+    IngestionRunCompany.objects.filter(run_id__in=old_ids).delete()
+    IngestionRun.objects.filter(id__in=old_ids).delete()
+    return len(old_ids)
+
+
+def run_companies(
+    tracker: RunTracker,
+    companies: list[Company],
+    fetch: Callable[[Company], Optional[dict]],
+    save: Callable[[dict], None],
+    workers: int = 1,
+    cache: Optional[LookupCache] = None,
+) -> list[Company]:
+    """
+    Fetches the data of every Company on worker threads and saves each response on
+    the calling thread in its own transaction, recording the outcome in the run.
+    Failed fetches are retried from the retry list. Companies that still fail, or
+    whose data cannot be saved, go on the dead-letter list instead of stopping the run.
+
+    :param tracker: RunTracker of the run
+    :param companies: Companies to process
+    :param fetch: Function returning the SEC API response of a Company, None on failure
+    :param save: Function saving a response
+    :param workers: Number of threads fetching SEC data
+    :param cache: Lookup cache used by save, reloaded after a failed save because
+        the ids it added within the rolled back transaction are gone
+    :return: Companies that failed
+    """
+
+    def fetch_company(company: Company) -> Optional[dict]:
+        tracker.started(company)
+        return fetch(company)
+
+    fetch_failed: list[Company] = []
+    failed: list[Company] = []
+    for company, resp in map_with_retry_list(
+        fetch_company, companies, workers=workers, failed=fetch_failed
+    ):
+        try:
+            with transaction.atomic():
+                save(resp)
+                if resp.get("not_modified"):
+                    mark_checked(company, tracker.run.api_type)
+        except Exception as err:
+            logger.exception(f"Saving SEC data of CIK {company.CIK} failed")
+            tracker.failed(company, repr(err))
+            failed.append(company)
+            if cache is not None:
+                cache.reload()
+        else:
+            tracker.done(company)
+    for company in fetch_failed:
+        tracker.failed(company, "SEC API request failed after retrying")
+    failed += fetch_failed
+    if failed:
+        ciks = ", ".join(str(company.CIK) for company in failed)
+        logger.error(f"{len(failed)} companies failed, CIK's: {ciks}")
+    log_requests_per_minute()
+    return failed
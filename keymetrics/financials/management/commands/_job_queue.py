@@ -0,0 +1,212 @@
+import logging
+import os
+import socket
+from datetime import timedelta
+from typing import Iterable, Optional
+
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from keymetrics.financials.models import Checksum, Company, IngestionJob
+
+from ._call_sec_api import backoff_delay, get_sec_data
+from ._checksum_checker import get_validators, mark_checked
+from ._concurrent import map_concurrently
+from ._lookup_cache import LookupCache
+from .load_financial_facts import save_sec_response as save_facts_response
+from .load_submissions import save_sec_response as save_submissions_response
+
+logger = logging.getLogger(__name__)
+
+MAX_JOB_ATTEMPTS = 5
+# Running jobs whose worker has not finished them in this time are claimed again
+STALE_JOB_TIMEOUT = timedelta(hours=1)
+
+
+def worker_name() -> str:
+    """
+    :return: Identifier of this worker process, host name and process id
+    """
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue_jobs(api_types: Iterable[str], companies: Optional[Iterable] = None) -> int:
+    """
+    Queues a job for every tracked Company and SEC API. Companies that already have a
+    queued or running job of the same type are skipped.
+
+    :param api_types: Checksum.TYPE_FACTS and/or Checksum.TYPE_SUBMISSIONS
+    :param companies: Companies to queue, defaults to all tracked Companies
+    :return: Number of jobs queued
+    """
+    if companies is None:
+        companies = Company.objects.filter(istracked=True)
+    company_ids = [c.id for c in companies]
+    jobs = [
+        (company_id, api_type) for api_type in api_types for company_id in company_ids
+    ]
+    if not jobs:
+        return 0
+    now = timezone.now()
+    # Inserted with one statement so the row count is exactly the jobs queued, even
+    # while other processes queue or claim jobs
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO "{IngestionJob._meta.db_table}" (company_id, api_type, '
+            "status, attempts, available_at, locked_by, error, created_at, "
+            "updated_at) SELECT job.company_id, job.api_type, %s, 0, %s, '', '', %s, "
+            "%s FROM unnest(%s::bigint[], %s::varchar[]) AS job(company_id, api_type) "
+            "ON CONFLICT DO NOTHING",
+            [
+                IngestionJob.STATUS_QUEUED,
+                now,
+                now,
+                now,
+                [company_id for company_id, _ in jobs],
+                [api_type for _, api_type in jobs],
+            ],
+        )
+        return cursor.rowcount
+
+
+def claim_jobs(limit: int = 1, worker: Optional[str] = None) -> list[IngestionJob]:
+    """
+    Claims up to limit available jobs. Rows locked by other workers are skipped
+    instead of waited on, so any number of workers can claim jobs concurrently.
+
+    :param limit: Maximum number of jobs to claim
+    :param worker: Name recorded on the claimed jobs, defaults to worker_name
+    :return: Claimed jobs, marked as running
+    """
+    now = timezone.now()
+    worker = worker or worker_name()
+    with transaction.atomic():
+        # Only the job rows are locked, not the joined Companies shared by other jobs
+        jobs = list(
+            IngestionJob.objects.select_for_update(skip_locked=True, of=("self",))
+            .filter(
+                Q(status=IngestionJob.STATUS_QUEUED, available_at__lte=now)
+                | Q(
+                    status=IngestionJob.STATUS_RUNNING,
+                    locked_at__lt=now - STALE_JOB_TIMEOUT,
+                )
+            )
+            .select_related("company")
+            .order_by("available_at", "id")[:limit]
+        )
+        if jobs:
+            IngestionJob.objects.filter(id__in=[job.id for job in jobs]).update(
+                status=IngestionJob.STATUS_RUNNING,
+                locked_by=worker,
+                locked_at=now,
+                attempts=F("attempts") + 1,
+            )
+    for job in jobs:
+        job.status = IngestionJob.STATUS_RUNNING
+        job.locked_by = worker
+        job.locked_at = now
+        job.attempts += 1
+    return jobs
+
+
+def _update_claimed_job(job: IngestionJob, **fields) -> bool:
+    """
+    Updates a job only while it is still claimed by the worker that claimed it, a
+    stale job may have been claimed again by another worker in the meantime
+
+    :param job: Claimed job
+    :return: False if the job is no longer claimed by its worker
+    """
+    updated = IngestionJob.objects.filter(
+        id=job.id, status=IngestionJob.STATUS_RUNNING, locked_by=job.locked_by
+    ).update(updated_at=timezone.now(), **fields)
+    if not updated:
+        logger.warning(f"Job {job.id} was claimed again by another worker, not updated")
+    return bool(updated)
+
+
+def complete_job(job: IngestionJob) -> bool:
+    """
+    :param job: Claimed job
+    :return: False if the job is no longer claimed by its worker
+    """
+    return _update_claimed_job(job, status=IngestionJob.STATUS_DONE, error="")
+
+
+def fail_job(job: IngestionJob, error: str) -> bool:
+    """
+    Queues a failed job again after a backoff delay, or marks it as failed once it
+    has used all its attempts
+
+    :param job: Claimed job
+    :param error: Description of the failure
+    :return: False if the job is no longer claimed by its worker
+    """
+    if job.attempts < MAX_JOB_ATTEMPTS:
+        status = IngestionJob.STATUS_QUEUED
+    else:
+        status = IngestionJob.STATUS_FAILED
+    available_at = timezone.now() + timedelta(seconds=backoff_delay(job.attempts, 30))
+    return _update_claimed_job(
+        job, status=status, error=error, available_at=available_at
+    )
+
+
+def fetch_job(job: IngestionJob, validators: Optional[dict]) -> Optional[dict]:
+    """
+    :param job: Claimed job
+    :param validators: ETag/Last-Modified of the previous response of the Company,
+        None if there is none
+    :return: SEC API response for the job, None on failure
+    """
+    if job.api_type == Checksum.TYPE_FACTS:
+        url = job.company.sec_facts_url
+    else:
+        url = job.company.sec_submissions_url
+    return get_sec_data(url, validators)
+
+
+def save_job(job: IngestionJob, resp: dict, cache: LookupCache):
+    if resp.get("not_modified"):
+        mark_checked(job.company, job.api_type)
+    elif job.api_type == Checksum.TYPE_FACTS:
+        save_facts_response(resp, cache=cache)
+    else:
+        save_submissions_response(resp)
+
+
+def process_jobs(jobs: list[IngestionJob], cache: LookupCache, workers: int = 1):
+    """
+    Fetches the SEC data of the jobs on worker threads and saves each response in its
+    own transaction. Submissions jobs are saved before facts jobs, so facts can refer
+    to the filings saved by the same batch.
+
+    :param jobs: Claimed jobs
+    :param cache: Lookup cache shared by every job of the worker
+    :param workers: Number of threads fetching SEC data
+    """
+    validators = {}
+    for api_type in {job.api_type for job in jobs}:
+        companies = [job.company for job in jobs if job.api_type == api_type]
+        validators[api_type] = get_validators(companies, api_type)
+
+    def fetch(job: IngestionJob) -> Optional[dict]:
+        return fetch_job(job, validators[job.api_type].get(job.company_id))
+
+    for api_type in (Checksum.TYPE_SUBMISSIONS, Checksum.TYPE_FACTS):
+        typed_jobs = [job for job in jobs if job.api_type == api_type]
+        for job, resp in map_concurrently(fetch, typed_jobs, workers=workers):
+            if resp is None:
+                fail_job(job, "SEC API request failed after retrying")
+                continue
+            try:
+                with transaction.atomic():
+                    save_job(job, resp, cache)
+            except Exception as err:
+                logger.exception(f"Job {job.id} for CIK {job.company.CIK} failed")
+                fail_job(job, repr(err))
+                # Ids added to the cache within the rolled back transaction are gone
+                cache.reload()
+            else:
+                complete_job(job)
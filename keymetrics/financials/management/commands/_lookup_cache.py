@@ -0,0 +1,149 @@
+import logging
+from typing import Iterable, Optional
+
+from keymetrics.financials.models import Company, Filing, FinancialConcept
+
+from ._periods import period_registry
+
+logger = logging.getLogger(__name__)
+
+
+class LookupCache:
+    """
+    In-memory key to id maps for the lookup tables referenced by FinancialFact.
+    Each table is loaded once per run with a single query and shared by every
+    Company in the run so facts can be resolved without per-row queries.
+    Time Dimensions are resolved through the process-wide period registry.
+    """
+
+    def __init__(self):
+        self.concepts = dict(FinancialConcept.objects.values_list("tag", "id"))
+        self.filings = self._load_filings()
+        self.companies: dict[int, Company] = {}
+        self._unknown_filings: set[tuple[int, str]] = set()
+        period_registry.load()
+
+    @staticmethod
+    def _load_filings(**filters) -> dict[tuple[int, str], int]:
+        return {
+            (company_id, accn_num): filing_id
+            for company_id, accn_num, filing_id in Filing.objects.filter(
+                **filters
+            ).values_list("company_id", "accn_num", "id")
+        }
+
+    def refresh(self):
+        """
+        Brings the cache up to date when it is kept across runs. Rows created since
+        the last refresh are loaded by id, everything is reloaded only if rows were
+        deleted in the meantime, e.g. by delete_financial_facts. The cached
+        Companies are reloaded with one query so their watermarks are current.
+        """
+        ciks = list(self.companies)
+        self._unknown_filings.clear()
+        current = (
+            self._refresh_concepts()
+            and self._refresh_filings()
+            and period_registry.refresh()
+        )
+        if not current:
+            logger.info("Lookup tables changed, reloading the lookup cache")
+            self.reload()
+        if ciks:
+            self.companies = {c.CIK: c for c in Company.objects.filter(CIK__in=ciks)}
+
+    def _refresh_concepts(self) -> bool:
+        """
+        :return: False if the map no longer matches the table, e.g. after deletes
+        """
+        last_id = max(self.concepts.values(), default=0)
+        self.concepts.update(
+            FinancialConcept.objects.filter(id__gt=last_id).values_list("tag", "id")
+        )
+        return FinancialConcept.objects.count() == len(self.concepts)
+
+    def _refresh_filings(self) -> bool:
+        """
+        :return: False if the map no longer matches the table, e.g. after deletes
+        """
+        last_id = max(self.filings.values(), default=0)
+        self.filings.update(self._load_filings(id__gt=last_id))
+        return Filing.objects.count() == len(self.filings)
+
+    def reload(self):
+        """
+        Reloads every map and the period registry from the DB. Used after a rolled
+        back transaction, whose new concepts, filings and time dimensions were added
+        to the maps but no longer exist.
+        """
+        self.concepts = dict(FinancialConcept.objects.values_list("tag", "id"))
+        self.filings = self._load_filings()
+        self.companies = {}
+        self._unknown_filings.clear()
+        period_registry.clear()
+        period_registry.load()
+
+    def company(self, cik: int) -> Company:
+        """
+        :param cik: CIK of the company
+        :return: Company model object, raises Company.DoesNotExist if it does not exist
+        """
+        if cik not in self.companies:
+            self.companies[cik] = Company.objects.get(CIK=cik)
+        return self.companies[cik]
+
+    def add_concepts(self, tags: Iterable[str]):
+        """
+        Adds the ids of newly created (or concurrently created) Financial Concepts
+
+        :param tags: XBRL tags of the concepts
+        """
+        missing = set(tags).difference(self.concepts)
+        if missing:
+            self.concepts.update(
+                FinancialConcept.objects.filter(tag__in=missing).values_list(
+                    "tag", "id"
+                )
+            )
+
+    def add_filings(self, accn_nums: Iterable[str], company_id: int):
+        """
+        Adds the ids of a Company's Filings created since the cache was loaded
+
+        :param accn_nums: Accession numbers of the filings
+        :param company_id: Id of the Company the filings belong to
+        """
+        missing = {a for a in accn_nums if (company_id, a) not in self.filings}
+        if missing:
+            self.filings.update(
+                self._load_filings(company_id=company_id, accn_num__in=missing)
+            )
+
+    def concept_id(self, tag: str) -> int:
+        """
+        :param tag: XBRL tag of the concept
+        :return: FinancialConcept id, raises KeyError if the concept does not exist
+        """
+        if tag not in self.concepts:
+            self.add_concepts([tag])
+        return self.concepts[tag]
+
+    def period_id(self, key: str) -> int:
+        """
+        :param key: Time Dimension key
+        :return: TimeDimension id, raises KeyError if the time dimension does not exist
+        """
+        return period_registry.period_id(key)
+
+    def filing_id(self, accn_num: str, company_id: int) -> Optional[int]:
+        """
+        :param accn_num: Accession number of the filing
+        :param company_id: Id of the Company the filing must belong to
+        :return: Filing id or None if the Company has no such filing (yet)
+        """
+        key = (company_id, accn_num)
+        if key not in self.filings and key not in self._unknown_filings:
+            self.add_filings([accn_num], company_id)
+            if key not in self.filings:
+                self._unknown_filings.add(key)
+        return self.filings.get(key)
@@ -0,0 +1,125 @@
+from array import array
+from typing import Iterator, NamedTuple, Optional, Union
+
+from keymetrics.financials.models import FinancialConcept
+
+from ._periods import Period, normalize_period
+
+
+class ConceptInfo(NamedTuple):
+    tag: str
+    name: str
+    description: str
+    unit: str
+    type: str
+
+
+def _intern(index: dict, values: list, value) -> int:
+    """
+    :return: Position of value in values, appending it the first time it is seen
+    """
+    position = index.get(value)
+    if position is None:
+        position = index[value] = len(values)
+        values.append(value)
+    return position
+
+
+class NormalizedFacts:
+    """
+    Columnar form of a us-gaap facts payload. Every fact is one position in the
+    parallel column arrays, which hold indexes into the lists of distinct concepts,
+    periods, accession numbers, forms and filed dates, so each distinct value is
+    stored and processed once however many facts refer to it.
+    """
+
+    def __init__(self):
+        self.concepts: list[ConceptInfo] = []
+        self.periods: list[Period] = []
+        self.accns: list[str] = []
+        self.forms: list[str] = []
+        self.filed: list[str] = []
+        self.concept_idx = array("i")
+        self.period_idx = array("i")
+        self.accn_idx = array("i")
+        self.form_idx = array("i")
+        self.filed_idx = array("i")
+        self.value = array("q")
+
+    def __len__(self) -> int:
+        return len(self.value)
+
+    def rows(self) -> Iterator[tuple[int, ...]]:
+        """
+        :return: Iterator of (concept_idx, period_idx, accn_idx, value, form_idx,
+            filed_idx) tuples, one per fact
+        """
+        return zip(
+            self.concept_idx,
+            self.period_idx,
+            self.accn_idx,
+            self.value,
+            self.form_idx,
+            self.filed_idx,
+        )
+
+
+def normalize_gaap_data(gaap_data: dict) -> NormalizedFacts:
+    """
+    Walks a us-gaap payload once and builds its columnar form. A concept's unit is the
+    last unit reported and its type is decided by the last entry of that unit.
+    Concepts without a label or description fall back to the tag.
+
+    :param gaap_data: SEC data from "us-gaap" key
+    :return: NormalizedFacts
+    """
+    facts = NormalizedFacts()
+    period_index: dict[tuple[Optional[str], str], int] = {}
+    accn_index: dict[str, int] = {}
+    form_index: dict[str, int] = {}
+    filed_index: dict[str, int] = {}
+    for tag, value in gaap_data.items():
+        units = value["units"]
+        if not units:
+            continue
+        concept = len(facts.concepts)
+        concept_type = FinancialConcept.TYPE_AS_OF
+        for unit, instance in units.items():
+            concept_type = FinancialConcept.TYPE_AS_OF
+            for entries in instance:
+                start = entries.get("start")
+                dates = (start, entries["end"])
+                period = period_index.get(dates)
+                if period is None:
+                    period = period_index[dates] = len(facts.periods)
+                    facts.periods.append(normalize_period(*dates))
+                facts.concept_idx.append(concept)
+                facts.period_idx.append(period)
+                facts.accn_idx.append(_intern(accn_index, facts.accns, entries["accn"]))
+                facts.form_idx.append(_intern(form_index, facts.forms, entries["form"]))
+                facts.filed_idx.append(
+                    _intern(filed_index, facts.filed, entries.get("filed", ""))
+                )
+                facts.value.append(int(entries["val"]))
+            if instance and "start" in instance[-1]:
+                concept_type = FinancialConcept.TYPE_PERIOD_ENDED
+        facts.concepts.append(
+            ConceptInfo(
+                tag=tag,
+                name=value.get("label") or tag,
+                description=value.get("description") or tag,
+                unit=unit,
+                type=concept_type,
+            )
+        )
+    return facts
+
+
+def as_normalized(data: Union[dict, NormalizedFacts]) -> NormalizedFacts:
+    """
+    :param data: us-gaap payload or its already normalized form
+    :return: NormalizedFacts
+    """
+    if isinstance(data, NormalizedFacts):
+        return data
+    return normalize_gaap_data(data)
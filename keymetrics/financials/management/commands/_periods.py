@@ -0,0 +1,148 @@
+import threading
+from datetime import date
+from functools import lru_cache
+from typing import Iterable, NamedTuple, Optional
+
+from dateutil import parser
+
+from keymetrics.financials.models import TimeDimension
+
+DAYS_PER_MONTH = 30.4
+
+
+class Period(NamedTuple):
+    start: Optional[str]
+    end: str
+    time_key: str
+    num_months: Optional[int]
+
+
+def parse_date(value: str) -> date:
+    """
+    SEC API dates are ISO formatted (YYYY-MM-DD), anything else falls back to dateutil
+
+    :param value: Date string
+    :return: Parsed date
+    """
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        return parser.parse(value).date()
+
+
+@lru_cache(maxsize=65536)
+def normalize_period(start: Optional[str], end: str) -> Period:
+    """
+    Computes the Time Dimension key and approximate number of months of a period.
+    Results are memoized by (start, end) so each distinct period is only computed once
+    per process, however many facts and stages refer to it.
+
+    :param start: Start date of a time range, None for a point in time
+    :param end: End date
+    :return: Period tuple
+    """
+    if start is None:
+        return Period(start=None, end=end, time_key=end, num_months=None)
+    num_months = round((parse_date(end) - parse_date(start)).days / DAYS_PER_MONTH)
+    return Period(
+        start=start,
+        end=end,
+        time_key=start + end + str(num_months),
+        num_months=num_months,
+    )
+
+
+class PeriodRegistry:
+    """
+    Process-wide map of Time Dimension keys to ids. The table is small and shared by
+    every Company, so it is loaded once per process and afterwards only periods that
+    have never been seen reach the DB.
+    """
+
+    def __init__(self):
+        self.ids: dict[str, int] = {}
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    def load(self):
+        """
+        Loads every existing Time Dimension, only the first call queries the DB
+        """
+        with self._lock:
+            if not self._loaded:
+                self.ids.update(TimeDimension.objects.values_list("key", "id"))
+                self._loaded = True
+
+    def register(self, periods: Iterable[Period]) -> dict[str, int]:
+        """
+        Inserts the periods that do not exist yet in a single bulk insert
+
+        :param periods: Periods referenced by the facts being saved, may repeat
+        :return: Key to id map of every Time Dimension registered so far
+        """
+        with self._lock:
+            self.load()
+            new = {}
+            for period in periods:
+                if period.time_key not in self.ids:
+                    new[period.time_key] = period
+            if new:
+                # Inserted in key order so concurrent processes cannot deadlock
+                TimeDimension.objects.bulk_create(
+                    [
+                        TimeDimension(
+                            key=key,
+                            start_date=new[key].start,
+                            end_date=new[key].end,
+                            months=new[key].num_months,
+                        )
+                        for key in sorted(new)
+                    ],
+                    ignore_conflicts=True,
+                )
+                self._fetch(new)
+            return self.ids
+
+    def _fetch(self, keys: Iterable[str]):
+        self.ids.update(
+            TimeDimension.objects.filter(key__in=list(keys)).values_list("key", "id")
+        )
+
+    def period_id(self, key: str) -> int:
+        """
+        :param key: Time Dimension key
+        :return: TimeDimension id, raises KeyError if the time dimension does not exist
+        """
+        if key not in self.ids:
+            with self._lock:
+                self.load()
+                if key not in self.ids:
+                    self._fetch([key])
+        return self.ids[key]
+
+    def refresh(self) -> bool:
+        """
+        Loads the Time Dimensions created since the registry was loaded
+
+        :return: False if the registry no longer matches the table, e.g. after deletes
+        """
+        with self._lock:
+            if not self._loaded:
+                self.load()
+                return True
+            last_id = max(self.ids.values(), default=0)
+            self.ids.update(
+                TimeDimension.objects.filter(id__gt=last_id).values_list("key", "id")
+            )
+            return TimeDimension.objects.count() == len(self.ids)
+
+    def clear(self):
+        """
+        Forgets every id, e.g. after Time Dimensions have been deleted
+        """
+        with self._lock:
+            self.ids = {}
+            self._loaded = False
+
+
+period_registry = PeriodRegistry()
@@ -0,0 +1,63 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, TypeVar
+
+from django.db import connections
+
+from ._call_sec_api import set_session
+from ._rate_limit import (
+    RedisRateLimiter,
+    SharedPacer,
+    get_rate_limiter,
+    set_rate_limiter,
+)
+
+R = TypeVar("R")
+
+
+def shard_ciks(ciks: list[int], processes: int) -> list[list[int]]:
+    """
+    Splits CIK's into shards by CIK modulo the number of processes, so a company is
+    always handled by the same shard
+
+    :param ciks: CIK's of the companies to process
+    :param processes: Number of shards
+    :return: List of non-empty shards of CIK's
+    """
+    shards: list[list[int]] = [[] for _ in range(processes)]
+    for cik in sorted(ciks):
+        shards[cik % processes].append(cik)
+    return [shard for shard in shards if shard]
+
+
+def _init_worker(rate_limiter):
+    # Every worker opens its own DB connection and SEC API session on first use
+    set_session(None)
+    set_rate_limiter(rate_limiter)
+
+
+def run_sharded(func: Callable[..., R], shards: list[list[int]], **kwargs) -> list[R]:
+    """
+    Calls func(ciks=shard, **kwargs) for every shard in its own forked worker process.
+    The workers share a single SEC rate limit, the Redis one if configured otherwise a
+    SharedPacer. Exceptions raised in a worker are re-raised once every shard has
+    finished.
+
+    :param func: Module level function processing the companies of a shard
+    :param shards: Shards of CIK's from shard_ciks
+    :param kwargs: Keyword arguments passed on to func
+    :return: Return values of func, one per shard
+    """
+    rate_limiter = get_rate_limiter()
+    if not isinstance(rate_limiter, RedisRateLimiter):
+        rate_limiter = SharedPacer()
+    # Connections must not be shared with the forked workers
+    connections.close_all()
+    with ProcessPoolExecutor(
+        max_workers=len(shards),
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=_init_worker,
+        initargs=(rate_limiter,),
+    ) as executor:
+        futures = [executor.submit(func, ciks=shard, **kwargs) for shard in shards]
+    return [future.result() for future in futures]
@@ -0,0 +1,373 @@
+import logging
+import multiprocessing
+import threading
+import time
+from typing import Optional
+
+import redis
+from django.conf import settings
+from pyrate_limiter import Duration, Limiter, RequestRate
+from redis.exceptions import RedisError, WatchError
+
+logger = logging.getLogger(__name__)
+
+# SEC fair access policy
+SEC_REQUESTS_PER_SECOND = 10
+# After the SEC throttles us the rate is cut by THROTTLE_BACKOFF, down to at most
+# MIN_RATE_FRACTION of the full rate, and climbs back to it over RECOVERY_SECONDS
+THROTTLE_BACKOFF = 0.5
+MIN_RATE_FRACTION = 0.1
+RECOVERY_SECONDS = 300.0
+
+
+def rate_fraction(fraction: float, throttled_at: float, now: float) -> float:
+    """
+    :param fraction: Fraction of the full rate set by the last throttle
+    :param throttled_at: Time of the last throttle
+    :param now: Current time
+    :return: Fraction of the full rate allowed now, recovered linearly since then
+    """
+    return min(1.0, fraction + max(0.0, now - throttled_at) / RECOVERY_SECONDS)
+
+
+def backed_off_fraction(fraction: float, throttled_at: float, now: float) -> float:
+    """
+    :return: Fraction of the full rate allowed after a throttle at now
+    """
+    current = rate_fraction(fraction, throttled_at, now)
+    return max(MIN_RATE_FRACTION, current * THROTTLE_BACKOFF)
+
+
+class ThreadSafeLimiter(Limiter):
+    """
+    Limiter whose bucket check and update happen under a lock so the SEC rate limit
+    is enforced across all worker threads sharing it. Delays happen outside the lock.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+
+    def try_acquire(self, *identities) -> None:
+        with self._lock:
+            super().try_acquire(*identities)
+
+
+class InProcessRateLimiter:
+    """
+    SEC rate limit shared by the threads of a single process. While backed off after
+    a throttle, requests are also spaced out at the reduced rate.
+
+    :param rate: Maximum number of requests per second
+    """
+
+    def __init__(self, rate: int = SEC_REQUESTS_PER_SECOND):
+        self.rate = rate
+        self._limiter = ThreadSafeLimiter(RequestRate(rate, Duration.SECOND))
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+        self._next_slot = 0.0
+        self._fraction = 1.0
+        self._throttled_at = 0.0
+
+    def current_rate(self) -> float:
+        """
+        :return: Requests per second currently allowed
+        """
+        return self.rate * rate_fraction(
+            self._fraction, self._throttled_at, time.time()
+        )
+
+    def acquire(self):
+        """
+        Blocks until a request can be made
+        """
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._paused_until, self._next_slot)
+            fraction = rate_fraction(self._fraction, self._throttled_at, now)
+            # At the full rate the spacing is left to the token bucket
+            self._next_slot = slot + (1 / (self.rate * fraction) if fraction < 1 else 0)
+        if slot > now:
+            time.sleep(slot - now)
+        with self._limiter.ratelimit("SEC", delay=True):
+            pass
+
+    def throttle(self, seconds: float):
+        """
+        Holds back every request for the given time, e.g. after the SEC throttled us,
+        and lowers the rate until it recovers
+
+        :param seconds: Number of seconds to pause requests for
+        """
+        with self._lock:
+            now = time.time()
+            self._fraction = backed_off_fraction(
+                self._fraction, self._throttled_at, now
+            )
+            self._throttled_at = now
+            self._paused_until = max(self._paused_until, now + seconds)
+
+
+class SharedPacer:
+    """
+    SEC rate limit shared by processes forked from the one that created it. Requests
+    are spaced 1 / rate seconds apart using a timestamp in shared memory, so any
+    number of processes together stay within the rate. The rate backoff after a
+    throttle is kept in shared memory too.
+
+    :param rate: Maximum number of requests per second
+    """
+
+    def __init__(self, rate: int = SEC_REQUESTS_PER_SECOND):
+        self.rate = rate
+        self.interval = 1 / rate
+        # Next free slot, rate fraction set by the last throttle and its time
+        self._state = multiprocessing.Array("d", [0.0, 1.0, 0.0])
+
+    def current_rate(self) -> float:
+        """
+        :return: Requests per second currently allowed across all processes
+        """
+        with self._state.get_lock():
+            _, fraction, throttled_at = self._state
+        return self.rate * rate_fraction(fraction, throttled_at, time.time())
+
+    def acquire(self):
+        """
+        Reserves the next free slot and sleeps until it starts
+        """
+        with self._state.get_lock():
+            now = time.time()
+            next_slot, fraction, throttled_at = self._state
+            slot = max(now, next_slot)
+            fraction = rate_fraction(fraction, throttled_at, now)
+            self._state[0] = slot + self.interval / fraction
+        if slot > now:
+            time.sleep(slot - now)
+
+    def throttle(self, seconds: float):
+        """
+        Holds back the requests of every process for the given time and lowers the
+        shared rate until it recovers
+
+        :param seconds: Number of seconds to pause requests for
+        """
+        with self._state.get_lock():
+            now = time.time()
+            next_slot, fraction, throttled_at = self._state
+            self._state[0] = max(next_slot, now + seconds)
+            self._state[1] = backed_off_fraction(fraction, throttled_at, now)
+            self._state[2] = now
+
+
+class RedisRateLimiter:
+    """
+    SEC rate limit shared by every process on every host using the same Redis.
+    Implemented as a token bucket in its GCRA form: Redis holds the theoretical
+    arrival time of the next request, each request reserves a slot with an optimistic
+    transaction and sleeps until its slot starts. The Redis server clock is used so
+    hosts do not need synchronized clocks. The number of requests made each minute is
+    counted in Redis so utilisation of the budget can be monitored. After a throttle
+    the shared rate is lowered in Redis and recovers over time.
+
+    If Redis cannot be reached the requests fall back to an in-process limiter.
+
+    :param client: redis.Redis client
+    :param rate: Maximum number of requests per second across all processes
+    :param burst: Number of requests that can be made at once after an idle period
+    :param key: Redis key prefix
+    """
+
+    def __init__(
+        self,
+        client,
+        rate: int = SEC_REQUESTS_PER_SECOND,
+        burst: int = 1,
+        key: str = "keymetrics:sec-rate-limit",
+    ):
+        self.client = client
+        self.rate = rate
+        self.interval = 1 / rate
+        self.burst = burst
+        self.key = key
+        self.fallback = InProcessRateLimiter(rate)
+        self._warned = False
+
+    def _counter_key(self, minute: int) -> str:
+        return f"{self.key}:requests:{minute}"
+
+    @property
+    def _backoff_key(self) -> str:
+        return f"{self.key}:backoff"
+
+    @staticmethod
+    def _read_backoff(values: list) -> tuple[float, float]:
+        """
+        :param values: Rate fraction and throttle time stored in Redis, None if unset
+        :return: Rate fraction set by the last throttle and the time of the throttle
+        """
+        fraction, throttled_at = values
+        if fraction is None or throttled_at is None:
+            return 1.0, 0.0
+        return float(fraction), float(throttled_at)
+
+    def current_rate(self) -> float:
+        """
+        :return: Requests per second currently allowed across all processes
+        """
+        seconds, microseconds = self.client.time()
+        backoff = self.client.hmget(self._backoff_key, "fraction", "since")
+        fraction, throttled_at = self._read_backoff(backoff)
+        return self.rate * rate_fraction(
+            fraction, throttled_at, seconds + microseconds / 1e6
+        )
+
+    def _reserve(self, pause: Optional[float] = None) -> float:
+        """
+        :param pause: Seconds to hold back every request for instead of reserving a slot
+        :return: Seconds to wait before the reserved slot starts
+        """
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(self.key, self._backoff_key)
+                    seconds, microseconds = pipe.time()
+                    now = seconds + microseconds / 1e6
+                    tat = max(float(pipe.get(self.key) or 0), now)
+                    fraction, throttled_at = self._read_backoff(
+                        pipe.hmget(self._backoff_key, "fraction", "since")
+                    )
+                    pipe.multi()
+                    if pause is not None:
+                        tat = max(tat, now + pause)
+                        pipe.set(self.key, tat)
+                        pipe.pexpire(self.key, int((tat - now + 1) * 1000) + 1000)
+                        pipe.hset(
+                            self._backoff_key,
+                            mapping={
+                                "fraction": backed_off_fraction(
+                                    fraction, throttled_at, now
+                                ),
+                                "since": now,
+                            },
+                        )
+                        pipe.expire(self._backoff_key, int(RECOVERY_SECONDS) + 60)
+                        pipe.execute()
+                        return 0.0
+                    interval = self.interval / rate_fraction(
+                        fraction, throttled_at, now
+                    )
+                    pipe.set(self.key, tat + interval)
+                    pipe.pexpire(self.key, int((tat - now + 1) * 1000) + 1000)
+                    counter = self._counter_key(int(now // 60))
+                    pipe.incr(counter)
+                    pipe.expire(counter, 3600)
+                    pipe.execute()
+                    return max(0.0, tat - now - (self.burst - 1) * interval)
+                except WatchError:
+                    continue
+
+    def acquire(self):
+        """
+        Reserves a slot in the shared budget and sleeps until it starts
+        """
+        try:
+            delay = self._reserve()
+        except RedisError as err:
+            if not self._warned:
+                logger.warning(
+                    f"Redis rate limit unavailable, limiting in-process: {err}"
+                )
+                self._warned = True
+            self.fallback.acquire()
+            return
+        self._warned = False
+        if delay > 0:
+            time.sleep(delay)
+
+    def throttle(self, seconds: float):
+        """
+        Holds back the requests of every process on every host for the given time
+        and lowers the shared rate until it recovers
+
+        :param seconds: Number of seconds to pause requests for
+        """
+        try:
+            self._reserve(pause=seconds)
+        except RedisError:
+            self.fallback.throttle(seconds)
+
+    def requests_per_minute(self, minutes: int = 5) -> dict[int, int]:
+        """
+        :param minutes: Number of recent minutes to report
+        :return: Requests made across all processes keyed by minute since the epoch
+        """
+        seconds, _ = self.client.time()
+        current = seconds // 60
+        keys = [current - i for i in range(minutes)]
+        counts = self.client.mget([self._counter_key(m) for m in keys])
+        return {m: int(c or 0) for m, c in zip(keys, counts)}
+
+
+def create_rate_limiter():
+    """
+    :return: RedisRateLimiter if SEC_RATE_LIMIT_REDIS_URL is set, otherwise an
+        InProcessRateLimiter
+    """
+    url = settings.SEC_RATE_LIMIT_REDIS_URL
+    if url:
+        client = redis.Redis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+        return RedisRateLimiter(client)
+    return InProcessRateLimiter()
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """
+    :return: Rate limiter applied to every SEC API request made by this process,
+        created from the settings on first use
+    """
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                _rate_limiter = create_rate_limiter()
+    return _rate_limiter
+
+
+def set_rate_limiter(rate_limiter: Optional[object]):
+    """
+    Replaces the rate limiter of this process, e.g. with a SharedPacer in worker
+    processes. None recreates it from the settings on next use.
+
+    :param rate_limiter: Object with acquire and throttle methods
+    """
+    global _rate_limiter
+    with _rate_limiter_lock:
+        _rate_limiter = rate_limiter
+
+
+def log_requests_per_minute(minutes: int = 5):
+    """
+    Logs the SEC requests made by every process in the recent minutes against the
+    budget, if the rate limiter counts them (Redis)
+
+    :param minutes: Number of recent minutes to report
+    """
+    limiter = get_rate_limiter()
+    if not isinstance(limiter, RedisRateLimiter):
+        return
+    try:
+        counts = limiter.requests_per_minute(minutes)
+    except RedisError as err:
+        logger.warning(f"SEC requests per minute unavailable: {err}")
+        return
+    budget = limiter.rate * 60
+    report = ", ".join(str(count) for _, count in sorted(counts.items()))
+    logger.info(
+        f"SEC requests per minute (of {budget}) in the last {minutes}: {report}"
+    )
@@ -0,0 +1,136 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from typing import IO, Optional
+
+from django.conf import settings
+
+
+class ResponseCache:
+    """
+    Content-addressed on-disk cache of raw SEC API responses. Response bodies are
+    stored once under their MD5 checksum (objects/ab/abcdef...) and each URL keeps a
+    reference to the checksum of its latest response (refs/<sha1 of url>). When the
+    objects exceed max_bytes the least recently used ones are evicted.
+
+    :param root: Directory of the cache
+    :param max_bytes: Maximum total size of the cached response bodies
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size: Optional[int] = None
+        (self.root / "objects").mkdir(parents=True, exist_ok=True)
+        (self.root / "refs").mkdir(parents=True, exist_ok=True)
+
+    def _object_path(self, checksum: str) -> Path:
+        return self.root / "objects" / checksum[:2] / checksum
+
+    def _ref_path(self, url: str) -> Path:
+        return self.root / "refs" / hashlib.sha1(url.encode()).hexdigest()
+
+    def _objects(self) -> list[Path]:
+        return [p for p in (self.root / "objects").glob("*/*") if p.is_file()]
+
+    def put(self, url: str, checksum: str, content: bytes):
+        """
+        Stores a response body and points the URL at it
+
+        :param url: URL of SEC API
+        :param checksum: MD5 checksum of the content
+        :param content: Raw response content
+        """
+        self.put_file(url, checksum, io.BytesIO(content))
+
+    def put_file(self, url: str, checksum: str, file: IO[bytes]):
+        """
+        Stores a response body read from a file object (from its current position)
+        and points the URL at it
+
+        :param url: URL of SEC API
+        :param checksum: MD5 checksum of the content
+        :param file: Binary file object holding the raw response content
+        """
+        path = self._object_path(checksum)
+        added = 0
+        if path.exists():
+            os.utime(path)
+        else:
+            path.parent.mkdir(exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as obj:
+                shutil.copyfileobj(file, obj)
+            os.replace(obj.name, path)
+            added = path.stat().st_size
+        ref = self._ref_path(url)
+        with tempfile.NamedTemporaryFile("w", dir=ref.parent, delete=False) as ref_file:
+            ref_file.write(checksum)
+        os.replace(ref_file.name, ref)
+        with self._lock:
+            if self._size is None:
+                size = sum(p.stat().st_size for p in self._objects())
+            else:
+                size = self._size + added
+            self._size = size
+            if size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """
+        Removes the least recently used objects until the cache fits in max_bytes
+        """
+        objects = []
+        for p in self._objects():
+            stat = p.stat()
+            objects.append((stat.st_mtime, stat.st_size, p))
+        objects.sort()
+        total = sum(size for _, size, _ in objects)
+        for _, size, path in objects:
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+        self._size = total
+
+    def get_path(self, url: str) -> Optional[tuple[Path, str]]:
+        """
+        Looks up the latest cached response for a URL and marks it as recently used
+
+        :param url: URL of SEC API
+        :return: Tuple of the path of the cached content and its MD5 checksum, or None
+            if the URL is not cached (or its content was evicted)
+        """
+        try:
+            checksum = self._ref_path(url).read_text()
+        except FileNotFoundError:
+            return None
+        path = self._object_path(checksum)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path, checksum
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """
+    :return: Response cache configured by SEC_RESPONSE_CACHE_DIR, or None if disabled
+    """
+    global _cache
+    root = settings.SEC_RESPONSE_CACHE_DIR
+    if not root:
+        return None
+    max_bytes = settings.SEC_RESPONSE_CACHE_MAX_BYTES
+    with _cache_lock:
+        if _cache is None or (_cache.root, _cache.max_bytes) != (Path(root), max_bytes):
+            _cache = ResponseCache(root, max_bytes)
+        return _cache
@@ -0,0 +1,134 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from statistics import median
+from typing import Iterable, Optional
+
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from keymetrics.financials.models import Company, Filing, IngestionJob
+
+# Filing history used to predict the next filing
+HISTORY = timedelta(days=3 * 366)
+# Fallback cadence of companies with a single filing
+DEFAULT_CADENCE = timedelta(days=91)
+# A filing is expected from WINDOW_BEFORE before until WINDOW_AFTER after its
+# predicted date
+WINDOW_BEFORE = timedelta(days=10)
+WINDOW_AFTER = timedelta(days=20)
+NEAR = timedelta(days=30)
+
+POLL_IN_WINDOW = timedelta(hours=12)
+POLL_NEAR = timedelta(days=3)
+POLL_DORMANT = timedelta(days=30)
+POLL_NO_HISTORY = timedelta(days=1)
+
+PERIODIC_FORMS = [Filing.TYPE_10Q, Filing.TYPE_10K]
+
+
+def median_timedelta(values: list[timedelta]) -> timedelta:
+    """
+    :param values: Durations, at least one
+    :return: Median duration
+    """
+    return timedelta(seconds=median(value.total_seconds() for value in values))
+
+
+def predict_next_filing(
+    filings: list[tuple[date, date]], today: date
+) -> Optional[date]:
+    """
+    Predicts the date of a company's next 10-Q/10-K from its reporting cadence (the
+    time between report dates) and its filing lag (the time between the report date
+    and the filing date)
+
+    :param filings: (report_date, date_filed) of the company's periodic filings
+    :param today: Date to predict from
+    :return: Predicted filing date on or after today - WINDOW_AFTER, None without history
+    """
+    if not filings:
+        return None
+    filings = sorted(filings)
+    report_dates = sorted({report_date for report_date, _ in filings})
+    gaps = [b - a for a, b in zip(report_dates, report_dates[1:])]
+    cadence = median_timedelta(gaps) if gaps else DEFAULT_CADENCE
+    cadence = min(max(cadence, timedelta(days=80)), timedelta(days=366))
+    recent = filings[-8:]
+    lag = median_timedelta([filed - report_date for report_date, filed in recent])
+    lag = max(lag, timedelta(0))
+    expected = report_dates[-1] + cadence + lag
+    # Missed filings roll forward, a late filer is polled in its next window
+    while expected < today - WINDOW_AFTER:
+        expected += cadence
+    return expected
+
+
+def poll_interval(expected: Optional[date], today: date) -> timedelta:
+    """
+    :param expected: Predicted date of the next filing
+    :param today: Current date
+    :return: Time to wait between polls of the company
+    """
+    if expected is None:
+        return POLL_NO_HISTORY
+    if expected - WINDOW_BEFORE <= today <= expected + WINDOW_AFTER:
+        return POLL_IN_WINDOW
+    if expected - NEAR <= today:
+        return POLL_NEAR
+    return POLL_DORMANT
+
+
+def schedule_companies(
+    api_types: Iterable[str],
+    budget: Optional[int] = None,
+    now: Optional[datetime] = None,
+) -> list[Company]:
+    """
+    Selects the tracked Companies due for a refresh. Companies in or near their
+    predicted filing window are polled often and dormant ones rarely. When more
+    Companies are due than the budget allows, the most overdue Companies in a filing
+    window go first.
+
+    :param api_types: SEC APIs polled for every selected Company, the last poll is the
+        last response of one of them, whichever command or job made the request
+    :param budget: Maximum number of SEC API requests, unlimited if None
+    :param now: Time to schedule at, defaults to now
+    :return: Companies to refresh
+    """
+    api_types = list(api_types)
+    now = now or timezone.now()
+    today = now.date()
+    active = IngestionJob.objects.filter(
+        status__in=[IngestionJob.STATUS_QUEUED, IngestionJob.STATUS_RUNNING],
+        api_type__in=api_types,
+    ).values("company_id")
+    companies = list(
+        Company.objects.filter(istracked=True)
+        .exclude(id__in=active)
+        .annotate(
+            last_polled=Max(
+                "checksums__checked_at",
+                filter=Q(checksums__api_type__in=api_types),
+            )
+        )
+    )
+    history = defaultdict(list)
+    for company_id, report_date, date_filed in Filing.objects.filter(
+        company__in=companies,
+        type__in=PERIODIC_FORMS,
+        report_date__gte=today - HISTORY,
+    ).values_list("company_id", "report_date", "date_filed"):
+        history[company_id].append((report_date, date_filed))
+
+    due = []
+    for company in companies:
+        interval = poll_interval(predict_next_filing(history[company.id], today), today)
+        last_polled = company.last_polled
+        if last_polled is not None and last_polled + interval > now:
+            continue
+        # Never polled first, then the longest since polled
+        due.append((interval, last_polled is not None, last_polled, company))
+    due.sort(key=lambda x: (x[0], x[1], x[2] or now, x[3].CIK))
+    if budget is not None:
+        due = due[: budget // max(len(api_types), 1)]
+    return [company for *_, company in due]
@@ -0,0 +1,161 @@
+import io
+import json
+from typing import IO, Any, Iterator, Optional
+
+WHITESPACE = " \t\n\r"
+
+
+class JSONStream:
+    """
+    Minimal incremental JSON reader. Objects can be walked key by key while only the
+    value currently being decoded is held in memory.
+
+    :param fp: Binary file object containing UTF-8 JSON
+    :param chunk_size: Number of characters read from the file at a time
+    """
+
+    def __init__(self, fp: IO[bytes], chunk_size: int = 65536):
+        self._reader = io.TextIOWrapper(fp, encoding="utf-8")
+        self._decoder = json.JSONDecoder()
+        self._chunk_size = chunk_size
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self, size: Optional[int] = None) -> bool:
+        """
+        Reads more data into the buffer, discarding what has already been consumed
+
+        :return: False if the end of the file has been reached
+        """
+        if self._eof:
+            return False
+        chunk = self._reader.read(size or self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        consumed = self._pos
+        self._buffer = self._buffer[consumed:] + chunk
+        self._pos = 0
+        return True
+
+    def _peek(self) -> str:
+        """
+        :return: Next non-whitespace character without consuming it
+        """
+        while True:
+            while self._pos < len(self._buffer):
+                if self._buffer[self._pos] not in WHITESPACE:
+                    return self._buffer[self._pos]
+                self._pos += 1
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON stream")
+
+    def _expect(self, char: str):
+        if self._peek() != char:
+            raise ValueError(f"Expected {char!r} at position {self._pos} of buffer")
+        self._pos += 1
+
+    def decode_value(self) -> Any:
+        """
+        Decodes and consumes the next complete JSON value
+        """
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                # Value spans past the buffer, grow it geometrically so large values
+                # are not re-parsed once per chunk
+                if not self._fill(max(self._chunk_size, len(self._buffer))):
+                    raise
+                continue
+            # A number at the very end of the buffer may have been cut short
+            if end == len(self._buffer) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    def skip_value(self):
+        """
+        Consumes the next JSON value, walking objects member by member
+        """
+        if self._peek() == "{":
+            for _ in self.iter_object():
+                self.skip_value()
+        else:
+            self.decode_value()
+
+    def iter_object(self) -> Iterator[str]:
+        """
+        Walks a JSON object yielding its keys. The caller must consume each member's
+        value (decode_value, skip_value or iter_object) before advancing the iterator.
+        """
+        self._expect("{")
+        if self._peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self.decode_value()
+            self._expect(":")
+            yield key
+            if self._peek() == ",":
+                self._pos += 1
+                continue
+            self._expect("}")
+            return
+
+
+class CompanyFactsStream:
+    """
+    Streams the "us-gaap" concepts out of an SEC companyfacts JSON payload one concept
+    at a time, so memory use is bounded by the largest single concept rather than
+    by the size of the company.
+
+    :param fp: Binary file object containing the companyfacts JSON
+    """
+
+    def __init__(self, fp: IO[bytes], chunk_size: int = 65536):
+        self._stream = JSONStream(fp, chunk_size=chunk_size)
+        self._members = self._stream.iter_object()
+        self._at_facts = False
+        self.header: dict = {}
+
+    def read_header(self) -> dict:
+        """
+        Reads the top level fields preceding "facts" (cik, entityName)
+
+        :return: Dictionary of the top level fields
+        """
+        if not self._at_facts:
+            for key in self._members:
+                if key == "facts":
+                    self._at_facts = True
+                    break
+                self.header[key] = self._stream.decode_value()
+        return self.header
+
+    def iter_us_gaap(self, batch_size: int = 100) -> Iterator[dict]:
+        """
+        Yields the "us-gaap" data in dictionaries of at most batch_size concepts
+
+        :param batch_size: Maximum number of concepts per batch
+        :return: Iterator of dictionaries in the same format as the "us-gaap" key
+        """
+        self.read_header()
+        if not self._at_facts:
+            return
+        batch = {}
+        for taxonomy in self._stream.iter_object():
+            if taxonomy != "us-gaap":
+                self._stream.skip_value()
+                continue
+            for tag in self._stream.iter_object():
+                batch[tag] = self._stream.decode_value()
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = {}
+        if batch:
+            yield batch
+        for _ in self._members:
+            self._stream.skip_value()
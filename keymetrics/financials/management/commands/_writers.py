@@ -0,0 +1,92 @@
+import csv
+import io
+from typing import Iterable, Iterator, Optional, Sequence, Type
+
+from django.db import connection, models, transaction
+
+WRITER_ORM = "orm"
+WRITER_COPY = "copy"
+WRITER_CHOICES = [WRITER_ORM, WRITER_COPY]
+
+
+class CSVRowReader(io.RawIOBase):
+    """
+    Read-only file object producing CSV lines from an iterable of row tuples on demand,
+    so rows can be streamed to COPY without building the whole payload in memory.
+    """
+
+    def __init__(self, rows: Iterable[Sequence]):
+        self._rows: Iterator[Sequence] = iter(rows)
+        self._line = io.StringIO()
+        self._writer = csv.writer(self._line)
+        self._pending = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        limit = -1 if size is None else size
+        while limit < 0 or len(self._pending) < limit:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            self._writer.writerow(row)
+            self._pending += self._line.getvalue().encode("utf-8")
+            self._line.seek(0)
+            self._line.truncate()
+        if limit < 0:
+            limit = len(self._pending)
+        data, self._pending = self._pending[:limit], self._pending[limit:]
+        return data
+
+
+def write_rows(
+    model: Type[models.Model],
+    fields: list[str],
+    rows: Iterable[Sequence],
+    writer: str = WRITER_ORM,
+):
+    """
+    Inserts rows into a model's table, ignoring rows that conflict with existing ones
+
+    :param model: Model class of the table
+    :param fields: Field attribute names (e.g. company_id) in the order of each row
+    :param rows: Row tuples of field values
+    :param writer: WRITER_ORM to use bulk_create or WRITER_COPY to use PostgreSQL COPY
+    """
+    if writer == WRITER_COPY:
+        copy_rows(model, fields, rows)
+    else:
+        objs = [model(**dict(zip(fields, row))) for row in rows]
+        model.objects.bulk_create(objs, ignore_conflicts=True)
+
+
+def copy_rows(model: Type[models.Model], fields: list[str], rows: Iterable[Sequence]):
+    """
+    Streams rows into a temporary staging table with COPY then merges them into the
+    model's table with INSERT ... SELECT ... ON CONFLICT DO NOTHING. No model instances
+    are created.
+
+    :param model: Model class of the table
+    :param fields: Field attribute names (e.g. company_id) in the order of each row
+    :param rows: Row tuples of field values
+    """
+    table = model._meta.db_table
+    staging = f"{table}_staging"
+    columns = ", ".join(f'"{model._meta.get_field(f).column}"' for f in fields)
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Left over when called again before the outer transaction commits. Qualified
+        # so a regular table with the same name is never dropped.
+        cursor.execute(f'DROP TABLE IF EXISTS pg_temp."{staging}"')
+        cursor.execute(
+            f'CREATE TEMPORARY TABLE "{staging}" ON COMMIT DROP AS '
+            f'SELECT {columns} FROM "{table}" WITH NO DATA'
+        )
+        cursor.copy_expert(
+            f'COPY "{staging}" ({columns}) FROM STDIN WITH (FORMAT csv)',
+            CSVRowReader(rows),
+        )
+        cursor.execute(
+            f'INSERT INTO "{table}" ({columns}) SELECT {columns} FROM "{staging}" '
+            "ON CONFLICT DO NOTHING"
+        )
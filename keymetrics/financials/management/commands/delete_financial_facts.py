@@ -1,12 +1,124 @@
-from django.core.management.base import BaseCommand
+import logging
+from typing import Optional
 
-from keymetrics.financials.models import Filing
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from keymetrics.financials.models import (
+    Checksum,
+    Company,
+    Filing,
+    FinancialFact,
+    SubmissionFile,
+)
+
+logger = logging.getLogger(__name__)
+
+DELETE_CHUNK_SIZE = 10000
 
 
 def delete_data():
-    Filing.objects.all().delete()
+    """
+    Deletes every Filing and Financial Fact with a single TRUNCATE ... CASCADE instead
+    of collecting the related rows in Python. Checksums, the record of saved extra
+    submissions files and the submissions watermarks are reset too, so the next load
+    saves all the data again.
+    """
+    tables = [Filing, FinancialFact, Checksum, SubmissionFile]
+    names = ", ".join(f'"{model._meta.db_table}"' for model in tables)
+    with connection.cursor() as cursor:
+        # Deferred foreign key checks pending in an outer transaction block TRUNCATE
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        cursor.execute(f"TRUNCATE {names} CASCADE")
+    Company.objects.exclude(submissions_watermark_accn="").update(
+        submissions_watermark_accn="", submissions_watermark_date=None
+    )
+
+
+def _delete_chunks(table: str, where: str, params: list, chunk_size: int) -> int:
+    """
+    Deletes the matching rows chunk_size at a time, each chunk in its own transaction
+    so locks and WAL stay bounded
+
+    :return: Number of rows deleted
+    """
+    deleted = 0
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM "{table}" WHERE id IN '
+                f'(SELECT id FROM "{table}" WHERE {where} LIMIT %s)',
+                params + [chunk_size],
+            )
+            deleted += cursor.rowcount
+            if cursor.rowcount < chunk_size:
+                return deleted
+
+
+def delete_company_data(
+    company_ids: list[int], chunk_size: int = DELETE_CHUNK_SIZE
+) -> tuple[int, int]:
+    """
+    Deletes the Filings and Financial Facts of the given Companies in chunks with raw
+    DELETE statements, without the ORM cascade collector
+
+    :param company_ids: Ids of the Companies
+    :param chunk_size: Number of rows deleted per statement
+    :return: Number of Financial Facts and Filings deleted
+    """
+    facts = FinancialFact._meta.db_table
+    filings = Filing._meta.db_table
+    facts_deleted = _delete_chunks(
+        facts,
+        f'company_id = ANY(%s) OR filing_id IN (SELECT id FROM "{filings}" '
+        "WHERE company_id = ANY(%s))",
+        [company_ids, company_ids],
+        chunk_size,
+    )
+    filings_deleted = _delete_chunks(
+        filings, "company_id = ANY(%s)", [company_ids], chunk_size
+    )
+    Checksum.objects.filter(company_id__in=company_ids).delete()
+    SubmissionFile.objects.filter(company_id__in=company_ids).delete()
+    Company.objects.filter(id__in=company_ids).update(
+        submissions_watermark_accn="", submissions_watermark_date=None
+    )
+    return facts_deleted, filings_deleted
+
+
+def purge(ciks: Optional[list[int]] = None, chunk_size: int = DELETE_CHUNK_SIZE):
+    """
+    :param ciks: Only delete the data of the Companies with these CIK's, all data if None
+    :param chunk_size: Number of rows deleted per statement when scoped to CIK's
+    """
+    if ciks is None:
+        delete_data()
+        return
+    companies = dict(Company.objects.filter(CIK__in=ciks).values_list("CIK", "id"))
+    unknown = set(ciks).difference(companies)
+    if unknown:
+        raise CommandError(f"Unknown CIK's: {', '.join(map(str, sorted(unknown)))}")
+    facts, filings = delete_company_data(list(companies.values()), chunk_size)
+    logger.info(f"Deleted {facts} financial facts and {filings} filings")
 
 
 class Command(BaseCommand):
+    help = "Deletes all filings and financial facts, or those of some companies"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--cik",
+            type=int,
+            nargs="+",
+            default=None,
+            help="Only delete the data of the companies with these CIK's",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=DELETE_CHUNK_SIZE,
+            help="Number of rows deleted per statement when deleting by CIK",
+        )
+
     def handle(self, *args, **options):
-        delete_data()
+        purge(ciks=options["cik"], chunk_size=options["chunk_size"])
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from keymetrics.financials.models import Checksum
+
+from ._job_queue import enqueue_jobs
+from ._scheduler import schedule_companies
+
+API_TYPES = {
+    "facts": [Checksum.TYPE_FACTS],
+    "submissions": [Checksum.TYPE_SUBMISSIONS],
+    "all": [Checksum.TYPE_SUBMISSIONS, Checksum.TYPE_FACTS],
+}
+
+
+class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--type",
+            choices=API_TYPES.keys(),
+            default="all",
+            help="SEC API to queue jobs for",
+        )
+        parser.add_argument(
+            "--schedule",
+            action="store_true",
+            help="Only queue companies due for a refresh given their filing cadence",
+        )
+        parser.add_argument(
+            "--budget",
+            type=int,
+            default=None,
+            help="Maximum number of SEC API requests to queue, implies --schedule",
+        )
+
+    def handle(self, *args, **options):
+        api_types = API_TYPES[options["type"]]
+        companies = None
+        if options["schedule"] or options["budget"] is not None:
+            companies = schedule_companies(api_types, budget=options["budget"])
+        queued = enqueue_jobs(api_types, companies=companies)
+        self.stdout.write(f"Queued {queued} ingestion jobs")
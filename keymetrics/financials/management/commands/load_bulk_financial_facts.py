@@ -0,0 +1,69 @@
+from functools import partial
+
+from django.core.management.base import BaseCommand
+
+from keymetrics.financials.models import Company
+
+from ._bulk_archive import BulkArchive, save_members
+from ._lookup_cache import LookupCache
+from ._measure import measure
+from ._writers import WRITER_CHOICES, WRITER_ORM
+from .load_financial_facts import save_sec_response
+
+
+@measure
+def load_archive(
+    path: str, workers: int = 4, tracked_only: bool = False, writer: str = WRITER_ORM
+) -> list[str]:
+    """
+    Saves financial facts for every Company in the SEC companyfacts.zip bulk archive.
+    Archive members are read and parsed on worker threads while the results are saved
+    through the same pipeline as load_financial_facts, each in its own transaction.
+
+    :param path: Local path of companyfacts.zip
+    :param workers: Number of threads reading archive members
+    :param tracked_only: Only load Companies marked as istracked = True
+    :param writer: Financial Fact writer, WRITER_ORM or WRITER_COPY
+    :return: Names of the members that could not be read or saved
+    """
+    companies = Company.objects.all()
+    if tracked_only:
+        companies = companies.filter(istracked=True)
+    with BulkArchive(path) as archive:
+        ciks = set(companies.values_list("CIK", flat=True))
+        members = archive.company_members(ciks)
+        cache = LookupCache()
+        save = partial(save_sec_response, cache=cache, writer=writer)
+        return save_members(archive, members, save, workers=workers, cache=cache)
+
+
+class Command(BaseCommand):
+    help = "Load financial facts from a local copy of the SEC companyfacts.zip archive"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Path of companyfacts.zip")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Number of threads reading archive members",
+        )
+        parser.add_argument(
+            "--tracked-only",
+            action="store_true",
+            help="Only load Companies marked as tracked",
+        )
+        parser.add_argument(
+            "--writer",
+            choices=WRITER_CHOICES,
+            default=WRITER_ORM,
+            help="Insert facts with the ORM (bulk_create) or PostgreSQL COPY",
+        )
+
+    def handle(self, *args, **options):
+        load_archive(
+            options["path"],
+            workers=options["workers"],
+            tracked_only=options["tracked_only"],
+            writer=options["writer"],
+        )
@@ -0,0 +1,67 @@
+from functools import partial
+
+from django.core.management.base import BaseCommand
+
+from keymetrics.financials.models import Company
+
+from ._bulk_archive import BulkArchive, save_members
+from ._measure import measure
+from ._writers import WRITER_CHOICES, WRITER_ORM
+from .load_submissions import save_sec_response
+
+
+@measure
+def load_archive(
+    path: str, workers: int = 4, tracked_only: bool = False, writer: str = WRITER_ORM
+) -> list[str]:
+    """
+    Saves filings for every Company in the SEC submissions.zip bulk archive, each in
+    its own transaction. Extra submissions files are read from the same archive
+    instead of the SEC API.
+
+    :param path: Local path of submissions.zip
+    :param workers: Number of threads reading archive members
+    :param tracked_only: Only load Companies marked as istracked = True
+    :param writer: Filing writer, WRITER_ORM or WRITER_COPY
+    :return: Names of the members that could not be read or saved
+    """
+    companies = Company.objects.all()
+    if tracked_only:
+        companies = companies.filter(istracked=True)
+    with BulkArchive(path) as archive:
+        ciks = set(companies.values_list("CIK", flat=True))
+        members = archive.company_members(ciks)
+        save = partial(save_sec_response, fetch_file=archive.read, writer=writer)
+        return save_members(archive, members, save, workers=workers)
+
+
+class Command(BaseCommand):
+    help = "Load filings from a local copy of the SEC submissions.zip archive"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Path of submissions.zip")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Number of threads reading archive members",
+        )
+        parser.add_argument(
+            "--tracked-only",
+            action="store_true",
+            help="Only load Companies marked as tracked",
+        )
+        parser.add_argument(
+            "--writer",
+            choices=WRITER_CHOICES,
+            default=WRITER_ORM,
+            help="Insert filings with the ORM (bulk_create) or PostgreSQL COPY",
+        )
+
+    def handle(self, *args, **options):
+        load_archive(
+            options["path"],
+            workers=options["workers"],
+            tracked_only=options["tracked_only"],
+            writer=options["writer"],
+        )
@@ -1,49 +1,139 @@
-from django.core.management.base import BaseCommand
+from typing import NamedTuple, Optional
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
 from keymetrics.financials.models import Company, Ticker
 
 from ._call_sec_api import get_sec_data
 
+BATCH_SIZE = 1000
+
+
+class UniverseDiff(NamedTuple):
+    new_companies: int
+    renamed_companies: int
+    new_tickers: int
+    moved_tickers: int
+    removed_tickers: int
+
 
-def save_company_data():
+def save_company_data() -> UniverseDiff:
     """
-    Bulk create new Company objects based on SEC Company Tickers JSON file
+    Syncs Company and Ticker objects with the SEC Company Tickers JSON file
 
+    :return: Counts of the changes applied
     """
     url = "https://www.sec.gov/files/company_tickers.json"
     resp = get_sec_data(url)
+    if resp is None:
+        raise CommandError(f"Could not fetch {url}")
     data = resp["data"]
-    objs_list = []
-    for key, value in data.items():
-        name = value["title"]
-        if not name:
-            name = value["ticker"]
-        obj = Company(
-            CIK=int(value["cik_str"]),
-            name=name,
+    with transaction.atomic():
+        company_ids, new_companies, renamed_companies = save_new_company_data(data)
+        new_tickers, moved_tickers, removed_tickers = save_ticker_data(
+            data, company_ids=company_ids
         )
-        objs_list.append(obj)
-    Company.objects.bulk_create(objs_list, ignore_conflicts=True)
-    save_ticker_data(data=data)
+    return UniverseDiff(
+        new_companies=new_companies,
+        renamed_companies=renamed_companies,
+        new_tickers=new_tickers,
+        moved_tickers=moved_tickers,
+        removed_tickers=removed_tickers,
+    )
 
 
-def save_ticker_data(data: dict):
+def company_names(data: dict) -> dict[int, str]:
     """
-    Adds Ticker objects based on previously added Company data & SEC Data
     :param data: SEC Data dict
+    :return: Company name by CIK, the name of the first (primary) ticker of a CIK is
+        used and the ticker symbol if the name is blank
     """
+    names: dict[int, str] = {}
+    for value in data.values():
+        names.setdefault(int(value["cik_str"]), value["title"] or value["ticker"])
+    return names
 
-    companies = Company.objects.all()
 
-    objs_list = []
-    for key, value in data.items():
-        obj = Ticker(
-            company=companies.get(CIK=int(value["cik_str"])), ticker=value["ticker"]
+def save_new_company_data(data: dict) -> tuple[dict[int, int], int, int]:
+    """
+    Creates new Companies and renames existing ones whose SEC name changed, diffing
+    against a single CIK to id map instead of querying per Company
+
+    :param data: SEC Data dict
+    :return: CIK to Company id map, number of Companies created and renamed
+    """
+    names = company_names(data)
+    existing = {
+        cik: (company_id, name)
+        for cik, company_id, name in Company.objects.values_list("CIK", "id", "name")
+    }
+    new = [
+        Company(CIK=cik, name=name)
+        for cik, name in names.items()
+        if cik not in existing
+    ]
+    renamed = [
+        Company(id=existing[cik][0], CIK=cik, name=name)
+        for cik, name in names.items()
+        if cik in existing and existing[cik][1] != name
+    ]
+    Company.objects.bulk_create(new, batch_size=BATCH_SIZE, ignore_conflicts=True)
+    Company.objects.bulk_update(renamed, ["name"], batch_size=BATCH_SIZE)
+    company_ids = {cik: company_id for cik, (company_id, _) in existing.items()}
+    if new:
+        company_ids.update(
+            Company.objects.filter(CIK__in=[c.CIK for c in new]).values_list(
+                "CIK", "id"
+            )
         )
-        objs_list.append(obj)
-    Ticker.objects.bulk_create(objs_list, ignore_conflicts=True)
+    return company_ids, len(new), len(renamed)
+
+
+def save_ticker_data(
+    data: dict, company_ids: Optional[dict[int, int]] = None
+) -> tuple[int, int, int]:
+    """
+    Syncs Ticker objects with the SEC Data: new tickers are created, tickers assigned
+    to another Company are moved and tickers no longer listed are removed
+
+    :param data: SEC Data dict
+    :param company_ids: CIK to Company id map, loaded with one query if not given
+    :return: Number of tickers created, moved and removed
+    """
+    if company_ids is None:
+        company_ids = dict(Company.objects.values_list("CIK", "id"))
+    tickers = {
+        value["ticker"]: company_ids[int(value["cik_str"])] for value in data.values()
+    }
+    existing = dict(Ticker.objects.values_list("ticker", "company_id"))
+    new = [
+        Ticker(ticker=ticker, company_id=company_id)
+        for ticker, company_id in tickers.items()
+        if ticker not in existing
+    ]
+    moved = [
+        ticker
+        for ticker, company_id in tickers.items()
+        if ticker in existing and existing[ticker] != company_id
+    ]
+    removed = [ticker for ticker in existing if ticker not in tickers]
+    if removed:
+        Ticker.objects.filter(ticker__in=removed).delete()
+    if moved:
+        moved_objs = list(Ticker.objects.filter(ticker__in=moved))
+        for obj in moved_objs:
+            obj.company_id = tickers[obj.ticker]
+        Ticker.objects.bulk_update(moved_objs, ["company"], batch_size=BATCH_SIZE)
+    Ticker.objects.bulk_create(new, batch_size=BATCH_SIZE, ignore_conflicts=True)
+    return len(new), len(moved), len(removed)
 
 
 class Command(BaseCommand):
     def handle(self, *args, **options):
-        save_company_data()
+        diff = save_company_data()
+        self.stdout.write(
+            ", ".join(
+                f"{name.replace('_', ' ')}: {n}" for name, n in diff._asdict().items()
+            )
+        )
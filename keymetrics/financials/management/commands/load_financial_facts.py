@@ -1,156 +1,389 @@
 import logging
+from typing import Callable, Optional, Union
 
-from dateutil import parser
 from django.core.management.base import BaseCommand
-from django.db.utils import IntegrityError
 
 from keymetrics.financials.models import (
     Checksum,
     Company,
-    Filing,
     FinancialConcept,
     FinancialFact,
-    TimeDimension,
 )
 
-from ._call_sec_api import get_sec_data
-from ._checksum_checker import checksum_checker
+from ._call_sec_api import (
+    download_sec_data,
+    get_sec_data,
+    replay_sec_data,
+    replay_sec_file,
+)
+from ._checksum_checker import checksum_checker, get_validators
+from ._ingestion_run import RunTracker, run_companies
+from ._lookup_cache import LookupCache
 from ._measure import measure
+from ._normalize import NormalizedFacts, as_normalized, normalize_gaap_data
+from ._periods import normalize_period, period_registry
+from ._processes import run_sharded, shard_ciks
+from ._stream_facts import CompanyFactsStream
+from ._writers import WRITER_CHOICES, WRITER_ORM, write_rows
 
 logger = logging.getLogger(__name__)
 
+STREAM_BATCH_SIZE = 100
+
+FACT_FIELDS = ["company_id", "filing_id", "concept_id", "period_id", "value"]
+
+SKIPPED_FORMS = {"8-K", "8-K/A"}
+
 
 @measure
-def fetch_sec_data():
+def fetch_sec_data(
+    workers: int = 1,
+    stream: bool = False,
+    writer: str = WRITER_ORM,
+    replay: bool = False,
+    incremental: bool = False,
+    processes: int = 1,
+    ciks: Optional[list[int]] = None,
+    resume: bool = False,
+    retry_failed: bool = False,
+    run_id: Optional[int] = None,
+    cache: Optional[LookupCache] = None,
+) -> list[Company]:
     """
     Queries DB for all tracked Companies and compiles list of URL's to call
+
+    :param workers: Number of threads downloading SEC data while the results are saved
+    :param stream: Parse the responses incrementally instead of loading them in memory
+    :param writer: Financial Fact writer, WRITER_ORM or WRITER_COPY
+    :param replay: Re-process the responses in the response cache without calling the
+        SEC API, even if their checksum has not changed
+    :param incremental: Diff facts against the existing ones by natural key instead of
+        skipping whole filings that already have facts
+    :param processes: Number of worker processes, each handling a shard of the
+        companies by CIK with its own DB connection under a shared SEC rate limit
+    :param ciks: Only process the tracked Companies with these CIK's
+    :param resume: Continue the latest unfinished ingestion run
+    :param retry_failed: Only retry the failed Companies of the latest ingestion run
+    :param run_id: Ingestion run to continue, used by the worker processes
+    :param cache: Lookup cache to reuse, e.g. kept warm across runs by the daemon
+    :return: Companies that failed and were put on the dead-letter list
     """
-    obs = Company.objects.filter(istracked=True)
-    url_list = [c.sec_facts_url for c in obs]
-    for url in url_list:
-        save_new_data(url)
+    tracker = RunTracker.start(
+        Checksum.TYPE_FACTS, resume=resume, retry_failed=retry_failed, run_id=run_id
+    )
+    if tracker is None:
+        logger.info("No failed companies to retry")
+        return []
+    companies = tracker.companies()
+    if ciks is not None:
+        companies = companies.filter(CIK__in=ciks)
+    if processes > 1:
+        shard_results = run_sharded(
+            fetch_sec_data,
+            shard_ciks(list(companies.values_list("CIK", flat=True)), processes),
+            workers=workers,
+            stream=stream,
+            writer=writer,
+            replay=replay,
+            incremental=incremental,
+            run_id=tracker.run.id,
+        )
+        tracker.finish()
+        return [company for failed in shard_results for company in failed]
+    obs = list(companies)
+    validators = get_validators(obs, Checksum.TYPE_FACTS)
+    if cache is None:
+        cache = LookupCache()
+    if replay:
+        fetch = replay_sec_file if stream else replay_sec_data
+    else:
+        fetch = download_sec_data if stream else get_sec_data
+    save: Callable[..., None]
+    if stream:
+        save = save_sec_stream
+    else:
+        save = save_sec_response
+
+    def fetch_company(company: Company) -> Optional[dict]:
+        return fetch(company.sec_facts_url, validators.get(company.id))
+
+    def save_company(resp: dict):
+        save(
+            resp,
+            cache=cache,
+            writer=writer,
+            force=replay,
+            incremental=incremental,
+        )
+
+    failed = run_companies(
+        tracker, obs, fetch_company, save_company, workers=workers, cache=cache
+    )
+    if run_id is None:
+        tracker.finish()
+    return failed
 
 
-def save_new_data(url: str):
+def save_new_data(
+    url: str, cache: Optional[LookupCache] = None, writer: str = WRITER_ORM
+):
     """
-    Checks if SEC API data received is new and if so calls save new data functions
+    Calls the SEC API and saves the data received
 
     :param url: SEC API URL
+    :param cache: Lookup cache shared by every Company in the run
+    :param writer: Financial Fact writer, WRITER_ORM or WRITER_COPY
     """
     resp = get_sec_data(url)
+    if resp is not None:
+        save_sec_response(resp, cache=cache, writer=writer)
+
+
+def save_sec_response(
+    resp: dict,
+    cache: Optional[LookupCache] = None,
+    writer: str = WRITER_ORM,
+    force: bool = False,
+    incremental: bool = False,
+):
+    """
+    Checks if SEC API data received is new and if so calls save new data functions
+
+    :param resp: Response from get_sec_data
+    :param cache: Lookup cache shared by every Company in the run
+    :param writer: Financial Fact writer, WRITER_ORM or WRITER_COPY
+    :param force: Save the data even if the checksum has not changed
+    :param incremental: Only insert facts whose natural key does not exist yet
+    """
+    if resp.get("not_modified"):
+        return
+    if cache is None:
+        cache = LookupCache()
     data = resp["data"]
     current_checksum = resp["checksum"]
-    gaap_data = data["facts"]["us-gaap"]
-    cik = data["cik"]
-    company = Company.objects.get(CIK=cik)
+    # Companies reporting only dei or ifrs facts have no us-gaap key
+    gaap_data = data["facts"].get("us-gaap", {})
+    company = cache.company(data["cik"])
 
-    checksum_match = checksum_checker(
-        current_checksum=current_checksum, company=company, api_type=Checksum.TYPE_FACTS
+    # Replayed data must not overwrite the stored checksum and validators
+    checksum_match = not force and checksum_checker(
+        current_checksum=current_checksum,
+        company=company,
+        api_type=Checksum.TYPE_FACTS,
+        etag=resp.get("etag", ""),
+        last_modified=resp.get("last_modified", ""),
     )
     if not checksum_match:
-        save_new_financial_concepts(gaap_data)
-        save_new_time_dimensions(gaap_data)
-        save_new_financial_facts(gaap_data=gaap_data, company=company)
+        facts = normalize_gaap_data(gaap_data)
+        save_new_financial_concepts(facts, cache=cache)
+        save_new_time_dimensions(facts)
+        save_new_financial_facts(
+            gaap_data=facts,
+            company=company,
+            cache=cache,
+            writer=writer,
+            existing_keys=existing_fact_keys(company) if incremental else None,
+        )
+
+
+def save_sec_stream(
+    resp: dict,
+    cache: Optional[LookupCache] = None,
+    batch_size: int = STREAM_BATCH_SIZE,
+    writer: str = WRITER_ORM,
+    force: bool = False,
+    incremental: bool = False,
+):
+    """
+    Streaming version of save_sec_response. Concepts are read from the downloaded file
+    one batch at a time and passed through the save new data functions, so memory use
+    does not grow with the size of the company.
+
+    :param resp: Response from download_sec_data
+    :param cache: Lookup cache shared by every Company in the run
+    :param batch_size: Number of us-gaap concepts saved at a time
+    :param writer: Financial Fact writer, WRITER_ORM or WRITER_COPY
+    :param force: Save the data even if the checksum has not changed
+    :param incremental: Only insert facts whose natural key does not exist yet
+    """
+    if resp.get("not_modified"):
+        return
+    # Closed whether saving succeeds or fails, which removes a downloaded temp file
+    with resp["file"] as file:
+        if cache is None:
+            cache = LookupCache()
+        stream = CompanyFactsStream(file)
+        company = cache.company(stream.read_header()["cik"])
+
+        # Replayed data must not overwrite the stored checksum and validators
+        checksum_match = not force and checksum_checker(
+            current_checksum=resp["checksum"],
+            company=company,
+            api_type=Checksum.TYPE_FACTS,
+            etag=resp.get("etag", ""),
+            last_modified=resp.get("last_modified", ""),
+        )
+        if checksum_match:
+            return
+
+        # Computed once up front so facts saved by earlier batches don't count as existing
+        existing_filings = existing_keys = None
+        if incremental:
+            existing_keys = existing_fact_keys(company)
+        else:
+            existing_filings = existing_fact_filings(company)
+        for gaap_data in stream.iter_us_gaap(batch_size=batch_size):
+            facts = normalize_gaap_data(gaap_data)
+            save_new_financial_concepts(facts, cache=cache)
+            save_new_time_dimensions(facts)
+            save_new_financial_facts(
+                gaap_data=facts,
+                company=company,
+                cache=cache,
+                existing_filings=existing_filings,
+                writer=writer,
+                existing_keys=existing_keys,
+            )
 
 
 @measure
-def save_new_financial_concepts(gaap_data: dict):
-    """
-    Saves new Financial Concepts if they do not already exist
-
-    :param gaap_data: SEC data from "us-gaap" key
-    """
-    for key, value in gaap_data.items():
-        if not FinancialConcept.objects.filter(tag=key).exists():
-            for unit, instance in value["units"].items():
-                concept_type = ""
-                for entries in instance:
-                    if "start" in entries:
-                        concept_type = FinancialConcept.TYPE_PERIOD_ENDED
-                    else:
-                        concept_type = FinancialConcept.TYPE_AS_OF
-                concept = FinancialConcept(
-                    tag=key,
-                    name=value["label"],
-                    description=value["description"],
-                    unit=unit,
-                    type=concept_type,
-                )
-            try:
-                concept.save()
-            except IntegrityError:
-                concept.name = concept.tag
-                concept.description = concept.tag
-                concept.save()
+def save_new_financial_concepts(
+    gaap_data: Union[dict, NormalizedFacts], cache: Optional[LookupCache] = None
+):
+    """
+    Saves new Financial Concepts in a single bulk insert. Incoming tags are diffed
+    against the tags in the lookup cache, so no query is made when all are known.
+
+    :param gaap_data: SEC data from "us-gaap" key or its normalized form
+    :param cache: Lookup cache the ids of new concepts are added to
+    """
+    facts = as_normalized(gaap_data)
+    if cache is None:
+        known = set(
+            FinancialConcept.objects.filter(
+                tag__in=[c.tag for c in facts.concepts]
+            ).values_list("tag", flat=True)
+        )
+    else:
+        known = set(cache.concepts)
+
+    # Inserted in tag order so concurrent processes cannot deadlock
+    obj_list = [
+        FinancialConcept(**concept._asdict())
+        for concept in sorted(facts.concepts)
+        if concept.tag not in known
+    ]
+    if obj_list:
+        FinancialConcept.objects.bulk_create(obj_list, ignore_conflicts=True)
+        if cache is not None:
+            cache.add_concepts(c.tag for c in obj_list)
 
 
 @measure
-def save_new_time_dimensions(gaap_data: dict):
+def save_new_time_dimensions(gaap_data: Union[dict, NormalizedFacts]) -> dict[str, int]:
     """
-    Saves new Time Dimensions if they do not already exist
+    Saves new Time Dimensions if they do not already exist, through the process-wide
+    period registry
 
-    :param gaap_data: SEC data from "us-gaap" key
+    :param gaap_data: SEC data from "us-gaap" key or its normalized form
+    :return: Key to id map of the registered Time Dimensions
     """
-    existing_dimensions_objs = TimeDimension.objects.all()
-    existing_dimensions_key_list = [t.key for t in existing_dimensions_objs]
+    return period_registry.register(as_normalized(gaap_data).periods)
+
 
-    obj_list = []
-    for key, value in gaap_data.items():
-        for unit, instance in value["units"].items():
-            for entries in instance:
-                dates = process_dates(entries)
-                if dates["time_key"] not in existing_dimensions_key_list:
-                    time_dimension = TimeDimension(
-                        key=dates["time_key"],
-                        start_date=dates["start"],
-                        end_date=dates["end"],
-                        months=dates["num_months"],
-                    )
-                    existing_dimensions_key_list.append(key)
-                    obj_list.append(time_dimension)
-    TimeDimension.objects.bulk_create(obj_list, ignore_conflicts=True)
+def existing_fact_filings(company: Company) -> set[str]:
+    """
+    :param company: Company model object
+    :return: Accession numbers of the filings the Company already has facts for
+    """
+    return set(
+        FinancialFact.objects.filter(company=company)
+        .values_list("filing__accn_num", flat=True)
+        .distinct()
+    )
+
+
+def existing_fact_keys(company: Company) -> set[tuple[int, int, int]]:
+    """
+    Natural keys of the Company's existing facts, matching the unique financial fact
+    constraint. Only the key columns are fetched, no model objects are created.
+
+    :param company: Company model object
+    :return: Set of (concept_id, period_id, value) tuples
+    """
+    return set(
+        FinancialFact.objects.filter(company=company).values_list(
+            "concept_id", "period_id", "value"
+        )
+    )
 
 
 @measure
-def save_new_financial_facts(gaap_data: dict, company: Company):
+def save_new_financial_facts(
+    gaap_data: Union[dict, NormalizedFacts],
+    company: Company,
+    cache: Optional[LookupCache] = None,
+    existing_filings: Optional[set[str]] = None,
+    writer: str = WRITER_ORM,
+    existing_keys: Optional[set[tuple[int, int, int]]] = None,
+):
     """
-    Saves new Financial Facts for a given Company
+    Saves new Financial Facts for a given Company. Filings, concepts and time
+    dimensions are resolved once per distinct value rather than once per fact.
 
-    :param gaap_data: SEC data from "us-gaap" key
+    :param gaap_data: SEC data from "us-gaap" key or its normalized form
     :param company: Company model object the fact relates to
+    :param cache: Lookup cache used to resolve filings, concepts and time dimensions
+    :param existing_filings: Accession numbers to skip, defaults to existing_fact_filings
+    :param writer: WRITER_ORM to insert with bulk_create or WRITER_COPY to use COPY
+    :param existing_keys: Natural keys from existing_fact_keys. When given, facts are
+        diffed on these keys instead of skipping existing filings, and the keys of the
+        facts inserted are added to the set
     :return:
     """
-    existing_facts = FinancialFact.objects.select_related("filing").filter(
-        company=company
-    )
-    existing_filings = [f.filing.accn_num for f in existing_facts]
-    filings = Filing.objects.filter(company=company)
-    concepts = FinancialConcept.objects.all()
-    time_dimensions = TimeDimension.objects.all()
-
-    obj_list = []
-    for key, value in gaap_data.items():
-        for unit, instance in value["units"].items():
-            for entries in instance:
-                dates = process_dates(entries)
-                if entries["form"] not in ["8-K", "8-K/A"]:
-                    try:
-                        filing = filings.get(accn_num=entries["accn"])
-                    except Filing.DoesNotExist as e:
-                        print(entries["accn"])
-                        logger.error(f'Accn {entries["accn"]} does not exist {e}')
-                    concept = concepts.get(tag=key)
-                    period = time_dimensions.get(key=dates["time_key"])
-                    if entries["accn"] not in existing_filings:
-                        obj = FinancialFact(
-                            company=company,
-                            filing=filing,
-                            concept=concept,
-                            period=period,
-                            value=int(entries["val"]),
-                        )
-                        obj_list.append(obj)
-    FinancialFact.objects.bulk_create(obj_list, ignore_conflicts=True)
+    if cache is None:
+        cache = LookupCache()
+    if existing_keys is None and existing_filings is None:
+        existing_filings = existing_fact_filings(company)
+    facts = as_normalized(gaap_data)
+
+    skipped_forms = {i for i, form in enumerate(facts.forms) if form in SKIPPED_FORMS}
+    concept_ids = [cache.concept_id(c.tag) for c in facts.concepts]
+    period_ids = [cache.period_id(p.time_key) for p in facts.periods]
+    # Accession numbers carrying only skipped forms (8-K) are never Filings, so they
+    # are not looked up
+    stored_accns = {
+        accn
+        for accn, form in zip(facts.accn_idx, facts.form_idx)
+        if form not in skipped_forms
+    }
+    filing_ids: list[Optional[int]] = []
+    for i, accn_num in enumerate(facts.accns):
+        if i not in stored_accns or (
+            existing_filings is not None and accn_num in existing_filings
+        ):
+            filing_ids.append(None)
+        else:
+            filing_ids.append(cache.filing_id(accn_num, company.id))
+
+    rows = []
+    for concept, period, accn, value, form, _ in facts.rows():
+        if form in skipped_forms:
+            continue
+        filing_id = filing_ids[accn]
+        if filing_id is None:
+            if existing_filings is None or facts.accns[accn] not in existing_filings:
+                logger.error(f"Accn {facts.accns[accn]} does not exist")
+            continue
+        if existing_keys is not None:
+            fact_key = (concept_ids[concept], period_ids[period], value)
+            if fact_key in existing_keys:
+                continue
+            existing_keys.add(fact_key)
+        rows.append(
+            (company.id, filing_id, concept_ids[concept], period_ids[period], value)
+        )
+    write_rows(FinancialFact, FACT_FIELDS, rows, writer=writer)
 
 
 def process_dates(data: dict) -> dict:
@@ -162,21 +395,63 @@ def process_dates(data: dict) -> dict:
     :param data: Dictionary for an individual financial fact from the API/US-GAAP data
     :return: Dictionary with the dates as well as an appro
     """
-    start = None
-    num_months = None
-    end = data["end"]
-
-    if "start" in data:
-        start_dt = parser.parse(data["start"])
-        end_dt = parser.parse(data["end"])
-        num_months = round(((end_dt - start_dt).days) / 30.4)
-        time_key = data["start"] + data["end"] + str(num_months)
-        start = data["start"]
-    else:
-        time_key = end
-    return {"start": start, "end": end, "time_key": time_key, "num_months": num_months}
+    return normalize_period(data.get("start"), data["end"])._asdict()
 
 
 class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of concurrent SEC API downloads (shared rate limit)",
+        )
+        parser.add_argument(
+            "--stream",
+            action="store_true",
+            help="Parse company facts incrementally instead of loading them in memory",
+        )
+        parser.add_argument(
+            "--writer",
+            choices=WRITER_CHOICES,
+            default=WRITER_ORM,
+            help="Insert facts with the ORM (bulk_create) or PostgreSQL COPY",
+        )
+        parser.add_argument(
+            "--replay",
+            action="store_true",
+            help="Re-process responses from the response cache without calling the SEC",
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Insert only facts whose natural key is not already in the DB",
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=1,
+            help="Number of worker processes, companies are sharded by CIK",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Continue the latest unfinished run, skipping finished companies",
+        )
+        parser.add_argument(
+            "--retry-failed",
+            action="store_true",
+            help="Only retry the companies that failed in the latest run",
+        )
+
     def handle(self, *args, **options):
-        fetch_sec_data()
+        fetch_sec_data(
+            workers=options["workers"],
+            stream=options["stream"],
+            writer=options["writer"],
+            replay=options["replay"],
+            incremental=options["incremental"],
+            processes=options["processes"],
+            resume=options["resume"],
+            retry_failed=options["retry_failed"],
+        )
@@ -1,87 +1,330 @@
+import logging
+from datetime import date
+from functools import partial
+from typing import Callable, Optional
+
 from django.core.management.base import BaseCommand
 
-from keymetrics.financials.models import Checksum, Company, Filing
+from keymetrics.financials.models import Checksum, Company, Filing, SubmissionFile
 
-from ._call_sec_api import get_sec_data
-from ._checksum_checker import checksum_checker
+from ._call_sec_api import get_sec_data, replay_sec_data
+from ._checksum_checker import checksum_checker, get_validators
+from ._concurrent import map_concurrently
+from ._ingestion_run import RunTracker, run_companies
+from ._lookup_cache import LookupCache
 from ._measure import measure
+from ._writers import WRITER_CHOICES, WRITER_ORM, write_rows
+
+FILING_FIELDS = ["company_id", "type", "accn_num", "report_date", "date_filed"]
+
+SUBMISSIONS_URL = "https://data.sec.gov/submissions/"
+
+logger = logging.getLogger(__name__)
 
 
-def fetch_sec_data():
+def fetch_sec_data(
+    workers: int = 1,
+    writer: str = WRITER_ORM,
+    replay: bool = False,
+    resume: bool = False,
+    retry_failed: bool = False,
+    cache: Optional[LookupCache] = None,
+) -> list[Company]:
     """
     Queries DB for all tracked Companies and compiles list of URL's to call
+
+    :param workers: Number of threads downloading SEC data while the results are saved
+    :param writer: Filing writer, WRITER_ORM or WRITER_COPY
+    :param replay: Re-process the responses in the response cache without calling the
+        SEC API, even if their checksum has not changed
+    :param resume: Continue the latest unfinished ingestion run
+    :param retry_failed: Only retry the failed Companies of the latest ingestion run
+    :param cache: Lookup cache to resolve Companies by CIK, e.g. kept warm across runs
+        by the daemon
+    :return: Companies that failed and were put on the dead-letter list
     """
-    obs = Company.objects.filter(istracked=True)
-    url_list = [c.sec_submissions_url for c in obs]
-    for url in url_list:
-        save_new_filing(url)
+    tracker = RunTracker.start(
+        Checksum.TYPE_SUBMISSIONS, resume=resume, retry_failed=retry_failed
+    )
+    if tracker is None:
+        logger.info("No failed companies to retry")
+        return []
+    obs = list(tracker.companies())
+    validators = get_validators(obs, Checksum.TYPE_SUBMISSIONS)
+    fetch = replay_sec_data if replay else get_sec_data
+    fetch_file = partial(fetch_extra_file, fetch=fetch)
 
+    def fetch_company(company: Company) -> Optional[dict]:
+        return fetch(company.sec_submissions_url, validators.get(company.id))
 
-@measure
-def save_new_filing(url: str):
+    def save_company(resp: dict):
+        save_sec_response(
+            resp,
+            fetch_file=fetch_file,
+            writer=writer,
+            force=replay,
+            cache=cache,
+            workers=workers,
+        )
+
+    failed = run_companies(
+        tracker, obs, fetch_company, save_company, workers=workers, cache=cache
+    )
+    tracker.finish()
+    return failed
+
+
+def save_new_filing(url: str, writer: str = WRITER_ORM):
     """
-    Checks if SEC API data received is new and if so calls process_submissions function
+    Calls the SEC API and saves the filings received
 
     :param url: SEC API URL
+    :param writer: Filing writer, WRITER_ORM or WRITER_COPY
     :return: None
     """
     resp = get_sec_data(url)
+    if resp is not None:
+        save_sec_response(resp, writer=writer)
+
+
+def fetch_extra_file(
+    file_name: str, fetch: Optional[Callable[[str], Optional[dict]]] = None
+) -> Optional[dict]:
+    """
+    Calls the SEC API for an extra submissions file
+
+    :param file_name: Name of the extra submissions file
+    :param fetch: Function used to call the SEC API, defaults to get_sec_data
+    :return: Response from get_sec_data
+    """
+    fetch = fetch or get_sec_data
+    return fetch(SUBMISSIONS_URL + file_name)
+
+
+@measure
+def save_sec_response(
+    resp: dict,
+    fetch_file: Callable[[str], Optional[dict]] = fetch_extra_file,
+    writer: str = WRITER_ORM,
+    force: bool = False,
+    cache: Optional[LookupCache] = None,
+    workers: int = 1,
+):
+    """
+    Checks if SEC API data received is new and if so calls process_submissions function
+
+    :param resp: Response from get_sec_data
+    :param fetch_file: Function returning the response for an extra submissions file name
+    :param writer: Filing writer, WRITER_ORM or WRITER_COPY
+    :param force: Save the filings even if the checksum has not changed
+    :param cache: Lookup cache to resolve the Company by CIK
+    :param workers: Number of threads fetching the extra submissions files
+    :return: None
+    """
+    if resp.get("not_modified"):
+        return
     data = resp["data"]
     current_checksum = resp["checksum"]
     cik = data["cik"]
-    company = Company.objects.get(CIK=cik)
+    company = cache.company(cik) if cache else Company.objects.get(CIK=cik)
     filing_data = data["filings"]["recent"]
-    extra_files = False
-    if data["filings"]["files"]:
-        extra_files = True
 
-    checksum_match = checksum_checker(
+    # Replayed data must not overwrite the stored checksum and validators
+    checksum_match = not force and checksum_checker(
         current_checksum=current_checksum,
         company=company,
         api_type=Checksum.TYPE_SUBMISSIONS,
+        etag=resp.get("etag", ""),
+        last_modified=resp.get("last_modified", ""),
     )
     if not checksum_match:
-        process_submissions(company=company, filing_data=filing_data)
+        new_count = None if force else new_filing_count(company, filing_data)
+        process_submissions(
+            company=company, filing_data=filing_data, writer=writer, limit=new_count
+        )
+        update_watermark(company, filing_data)
 
         # Submissions API only returns most recent 1000 filings, older companies have more in extra submission files
-        if extra_files:
-            extra_file_list = data["filings"]["files"]
-            file_names = [x["name"] for x in extra_file_list]
-            for file in file_names:
-                url = "https://data.sec.gov/submissions/" + file
-                resp = get_sec_data(url)
-                data = resp["data"]
-                process_submissions(company=company, filing_data=data)
+        if data["filings"]["files"]:
+            missing = save_extra_files(
+                company,
+                data["filings"]["files"],
+                fetch_file=fetch_file,
+                writer=writer,
+                workers=workers,
+                force=force,
+            )
+            if missing and not force:
+                # Forget the response so the next run fetches it again instead of
+                # matching the checksum, and retries the files that were not saved
+                Checksum.objects.filter(
+                    company=company, api_type=Checksum.TYPE_SUBMISSIONS
+                ).update(checksum="", etag="", last_modified="")
+
+
+def save_extra_files(
+    company: Company,
+    files: list[dict],
+    fetch_file: Callable[[str], Optional[dict]] = fetch_extra_file,
+    writer: str = WRITER_ORM,
+    workers: int = 1,
+    force: bool = False,
+) -> list[str]:
+    """
+    Fetches the extra submissions files of a Company concurrently and saves their
+    filings. Extra files hold older filings and do not change, so the files already
+    saved are skipped.
+
+    :param company: Company model object
+    :param files: "files" list of the submissions response
+    :param fetch_file: Function returning the response for an extra submissions file name
+    :param writer: Filing writer, WRITER_ORM or WRITER_COPY
+    :param workers: Number of threads fetching the files
+    :param force: Fetch the files again even if they were saved before
+    :return: Names of the files that could not be fetched
+    """
+    missing = []
+    saved = set()
+    if not force:
+        saved = set(company.submission_files.values_list("name", flat=True))
+    new_files = {f["name"]: f for f in files if f["name"] not in saved}
+    for name, resp in map_concurrently(fetch_file, list(new_files), workers=workers):
+        if resp is None:
+            logger.error(f"Submissions file {name} of CIK {company.CIK} not saved")
+            missing.append(name)
+            continue
+        process_submissions(company=company, filing_data=resp["data"], writer=writer)
+        SubmissionFile.objects.bulk_create(
+            [
+                SubmissionFile(
+                    company=company,
+                    name=name,
+                    filing_count=new_files[name].get("filingCount"),
+                    filing_from=new_files[name].get("filingFrom"),
+                    filing_to=new_files[name].get("filingTo"),
+                )
+            ],
+            ignore_conflicts=True,
+        )
+    return missing
+
 
+def new_filing_count(company: Company, filing_data: dict) -> Optional[int]:
+    """
+    Counts the filings newer than the Company's watermark. The Submissions API lists
+    the recent filings newest first, so the scan stops at the watermark filing or the
+    first filing made before the watermark date.
 
-def process_submissions(company: Company, filing_data: dict):
+    :param company: Company model object
+    :param filing_data: "recent" block of the submissions response
+    :return: Number of leading filings that are new, None if there is no watermark
+    """
+    if not company.submissions_watermark_accn:
+        return None
+    watermark_date = str(company.submissions_watermark_date or "")
+    accn_list = filing_data["accessionNumber"]
+    filing_date_list = filing_data["filingDate"]
+    for index, accn in enumerate(accn_list):
+        if accn == company.submissions_watermark_accn:
+            return index
+        if filing_date_list[index] < watermark_date:
+            return index
+    return len(accn_list)
+
+
+def update_watermark(company: Company, filing_data: dict):
+    """
+    Records the newest filing of the recent block as the Company's watermark
+
+    :param company: Company model object
+    :param filing_data: "recent" block of the submissions response
+    """
+    if not filing_data["accessionNumber"]:
+        return
+    accn = filing_data["accessionNumber"][0]
+    if accn == company.submissions_watermark_accn:
+        return
+    company.submissions_watermark_accn = accn
+    company.submissions_watermark_date = date.fromisoformat(
+        filing_data["filingDate"][0]
+    )
+    company.save(
+        update_fields=["submissions_watermark_accn", "submissions_watermark_date"]
+    )
+
+
+def process_submissions(
+    company: Company,
+    filing_data: dict,
+    writer: str = WRITER_ORM,
+    limit: Optional[int] = None,
+):
     """
     Adds all 10-K/10-Q (and amended versions) from the SEC API data
 
     :param company: Company model object
     :param filing_data:
+    :param writer: WRITER_ORM to insert with bulk_create or WRITER_COPY to use COPY
+    :param limit: Only scan this many of the newest filings, e.g. from new_filing_count
     :return: None
     """
     form_list = filing_data["form"]
+    if limit is not None:
+        form_list = form_list[:limit]
     report_date_list = filing_data["reportDate"]
     filing_date_list = filing_data["filingDate"]
     accn_list = filing_data["accessionNumber"]
     indices = [
         i for i, x in enumerate(form_list) if x in ["10-K", "10-Q", "10-K/A", "10-Q/A"]
     ]
-    obj_list = []
-    for index in indices:
-        obj = Filing(
-            company=company,
-            type=form_list[index],
-            accn_num=accn_list[index],
-            report_date=report_date_list[index],
-            date_filed=filing_date_list[index],
+    rows = [
+        (
+            company.id,
+            form_list[index],
+            accn_list[index],
+            report_date_list[index],
+            filing_date_list[index],
         )
-        obj_list.append(obj)
-    Filing.objects.bulk_create(obj_list, ignore_conflicts=True)
+        for index in indices
+    ]
+    write_rows(Filing, FILING_FIELDS, rows, writer=writer)
 
 
 class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of concurrent SEC API downloads (shared rate limit)",
+        )
+        parser.add_argument(
+            "--writer",
+            choices=WRITER_CHOICES,
+            default=WRITER_ORM,
+            help="Insert filings with the ORM (bulk_create) or PostgreSQL COPY",
+        )
+        parser.add_argument(
+            "--replay",
+            action="store_true",
+            help="Re-process responses from the response cache without calling the SEC",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Continue the latest unfinished run, skipping finished companies",
+        )
+        parser.add_argument(
+            "--retry-failed",
+            action="store_true",
+            help="Only retry the companies that failed in the latest run",
+        )
+
     def handle(self, *args, **options):
-        fetch_sec_data()
+        fetch_sec_data(
+            workers=options["workers"],
+            writer=options["writer"],
+            replay=options["replay"],
+            resume=options["resume"],
+            retry_failed=options["retry_failed"],
+        )
@@ -0,0 +1,95 @@
+import logging
+from typing import Optional
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from keymetrics.financials.models import Checksum, Company, FinancialFact
+
+from ._call_sec_api import get_sec_data
+from ._checksum_checker import checksum_checker
+from ._lookup_cache import LookupCache
+from ._normalize import normalize_gaap_data
+from ._writers import WRITER_CHOICES, WRITER_COPY
+from .load_financial_facts import (
+    save_new_financial_concepts,
+    save_new_financial_facts,
+    save_new_time_dimensions,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def reload_company_facts(
+    company: Company, cache: Optional[LookupCache] = None, writer: str = WRITER_COPY
+) -> bool:
+    """
+    Replaces the Financial Facts of a Company with a fresh copy from the SEC API.
+    The response is downloaded and parsed, and its concepts and time dimensions are
+    saved, before the swap. The swap deletes the old facts and writes the new ones
+    (through a COPY staging table by default) in one transaction, so readers see
+    either the old facts or the new ones. Filings are kept.
+
+    :param company: Company model object
+    :param cache: Lookup cache shared by every Company reloaded
+    :param writer: Financial Fact writer, WRITER_ORM or WRITER_COPY
+    :return: True if the facts were replaced, False if the SEC API request failed
+    """
+    resp = get_sec_data(company.sec_facts_url)
+    if resp is None:
+        return False
+    if cache is None:
+        cache = LookupCache()
+    facts = normalize_gaap_data(resp["data"]["facts"].get("us-gaap", {}))
+    save_new_financial_concepts(facts, cache=cache)
+    save_new_time_dimensions(facts)
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM "{FinancialFact._meta.db_table}" WHERE company_id = %s',
+                [company.id],
+            )
+        save_new_financial_facts(
+            gaap_data=facts,
+            company=company,
+            cache=cache,
+            existing_filings=set(),
+            writer=writer,
+        )
+        checksum_checker(
+            current_checksum=resp["checksum"],
+            company=company,
+            api_type=Checksum.TYPE_FACTS,
+            etag=resp.get("etag", ""),
+            last_modified=resp.get("last_modified", ""),
+        )
+    return True
+
+
+class Command(BaseCommand):
+    help = "Replaces the financial facts of companies with a fresh copy from the SEC"
+
+    def add_arguments(self, parser):
+        parser.add_argument("cik", type=int, nargs="+", help="CIK's of the companies")
+        parser.add_argument(
+            "--writer",
+            choices=WRITER_CHOICES,
+            default=WRITER_COPY,
+            help="Insert facts with the ORM (bulk_create) or PostgreSQL COPY",
+        )
+
+    def handle(self, *args, **options):
+        companies = list(Company.objects.filter(CIK__in=options["cik"]))
+        unknown = set(options["cik"]).difference(c.CIK for c in companies)
+        if unknown:
+            raise CommandError(f"Unknown CIK's: {', '.join(map(str, sorted(unknown)))}")
+        cache = LookupCache()
+        failed = [
+            company.CIK
+            for company in companies
+            if not reload_company_facts(company, cache=cache, writer=options["writer"])
+        ]
+        if failed:
+            raise CommandError(
+                f"Reload failed for CIK's: {', '.join(map(str, failed))}"
+            )
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+
+from ._daemon import IngestionDaemon
+from ._writers import WRITER_CHOICES, WRITER_ORM
+from .enqueue_ingestion_jobs import API_TYPES
+
+
+class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--type",
+            choices=API_TYPES.keys(),
+            default="all",
+            help="SEC API to refresh each cycle",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=900.0,
+            help="Seconds between the start of consecutive refresh cycles",
+        )
+        parser.add_argument(
+            "--cycles",
+            type=int,
+            default=None,
+            help="Stop after this many cycles instead of running until stopped",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of concurrent SEC API downloads (shared rate limit)",
+        )
+        parser.add_argument(
+            "--writer",
+            choices=WRITER_CHOICES,
+            default=WRITER_ORM,
+            help="Insert rows with the ORM (bulk_create) or PostgreSQL COPY",
+        )
+        parser.add_argument(
+            "--status-file",
+            default=None,
+            help="JSON file the timings of recent cycles are written to",
+        )
+
+    def handle(self, *args, **options):
+        daemon = IngestionDaemon(
+            API_TYPES[options["type"]],
+            interval=options["interval"],
+            workers=options["workers"],
+            writer=options["writer"],
+            status_file=options["status_file"],
+        )
+        daemon.run(cycles=options["cycles"])
@@ -0,0 +1,80 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from ._job_queue import claim_jobs, process_jobs, worker_name
+from ._lookup_cache import LookupCache
+from ._rate_limit import log_requests_per_minute
+
+logger = logging.getLogger(__name__)
+
+
+def run_worker(
+    batch_size: int = 10,
+    workers: int = 1,
+    exit_when_empty: bool = False,
+    poll_interval: float = 10.0,
+) -> int:
+    """
+    Claims and processes queued ingestion jobs until the queue is empty or forever.
+    Any number of workers can run at once, on any host using the same database.
+
+    :param batch_size: Number of jobs claimed at once
+    :param workers: Number of threads fetching SEC data
+    :param exit_when_empty: Return once no job is available instead of polling
+    :param poll_interval: Seconds to wait before polling an empty queue again
+    :return: Number of jobs processed
+    """
+    name = worker_name()
+    cache = LookupCache()
+    processed = 0
+    while True:
+        jobs = claim_jobs(limit=batch_size, worker=name)
+        if not jobs:
+            if exit_when_empty:
+                return processed
+            time.sleep(poll_interval)
+            continue
+        # Filings and Companies saved by other workers since the last batch
+        cache.refresh()
+        process_jobs(jobs, cache, workers=workers)
+        processed += len(jobs)
+        logger.info(f"Worker {name} processed {processed} jobs")
+        log_requests_per_minute()
+
+
+class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10,
+            help="Number of jobs claimed at once",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of concurrent SEC API downloads (shared rate limit)",
+        )
+        parser.add_argument(
+            "--exit-when-empty",
+            action="store_true",
+            help="Stop once the queue is empty instead of polling for new jobs",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=10.0,
+            help="Seconds to wait before polling an empty queue again",
+        )
+
+    def handle(self, *args, **options):
+        processed = run_worker(
+            batch_size=options["batch_size"],
+            workers=options["workers"],
+            exit_when_empty=options["exit_when_empty"],
+            poll_interval=options["poll_interval"],
+        )
+        self.stdout.write(f"Processed {processed} ingestion jobs")
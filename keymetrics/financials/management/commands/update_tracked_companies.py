@@ -1,128 +1,100 @@
+from pathlib import Path
+from typing import Iterable, NamedTuple
+
 from django.core.management.base import BaseCommand
+from django.db import transaction
 
 from keymetrics.financials.models import Company, Ticker
 
+DEFAULT_TICKER_FILE = Path(__file__).resolve().parent.parent / "tracked_companies.txt"
+
+
+class TrackingDiff(NamedTuple):
+    tracked: int
+    untracked: int
+    unknown: list[str]
+
+
+def read_ticker_file(path) -> list[str]:
+    """
+    :param path: Text file with one ticker symbol per line, # starts a comment
+    :return: Ticker symbols in the file
+    """
+    tickers = []
+    with open(path) as f:
+        for line in f:
+            ticker = line.split("#", 1)[0].strip()
+            if ticker:
+                tickers.append(ticker)
+    return tickers
+
 
 def reset_tracked_companies():
     """
     Sets all companies to istracked = False
     """
-    obs = Company.objects.all()
-    for company in obs:
-        company.istracked = False
-    Company.objects.bulk_update(obs, ["istracked"])
+    Company.objects.filter(istracked=True).update(istracked=False)
 
 
-def update_tracked_companies(tracked_companies_list: list[str]):
+def update_tracked_companies(
+    tracked_companies_list: Iterable[str], untrack_others: bool = False
+) -> TrackingDiff:
     """
     Update tracked companies given a list of ticker symbols. Only calling SEC API for
-    companies marked as istracked = True
+    companies marked as istracked = True. The tickers are resolved with one query and
+    only the companies whose tracking changes are updated.
 
     :param tracked_companies_list: List of ticker symbols (str) for companies to be tracked
-    :return: None
+    :param untrack_others: Stop tracking the companies that are not in the list
+    :return: Number of companies newly tracked and untracked, and the unknown tickers
     """
-    ticker_list = [Ticker.objects.get(ticker=t) for t in tracked_companies_list]
-    company_list = [t.company for t in ticker_list]
-    for company in company_list:
-        company.istracked = True
-    Company.objects.bulk_update(company_list, ["istracked"])
+    tickers = {t.strip() for t in tracked_companies_list}
+    company_ids = dict(
+        Ticker.objects.filter(ticker__in=tickers).values_list("ticker", "company_id")
+    )
+    unknown = sorted(tickers.difference(company_ids))
+    wanted = set(company_ids.values())
+    with transaction.atomic():
+        current = set(
+            Company.objects.filter(istracked=True).values_list("id", flat=True)
+        )
+        tracked = Company.objects.filter(id__in=wanted - current).update(istracked=True)
+        untracked = 0
+        if untrack_others:
+            untracked = Company.objects.filter(id__in=current - wanted).update(
+                istracked=False
+            )
+    return TrackingDiff(tracked=tracked, untracked=untracked, unknown=unknown)
 
 
 class Command(BaseCommand):
+    help = "Sets the tracked companies from ticker symbols given as arguments or files"
+
+    def add_arguments(self, parser):
+        parser.add_argument("tickers", nargs="*", help="Ticker symbols to track")
+        parser.add_argument(
+            "--file",
+            action="append",
+            default=[],
+            help="File with one ticker symbol per line, may be given more than once "
+            f"(default: {DEFAULT_TICKER_FILE.name} if no tickers are given)",
+        )
+        parser.add_argument(
+            "--add",
+            action="store_true",
+            help="Keep tracking the companies that are not listed",
+        )
+
     def handle(self, *args, **options):
-        reset_tracked_companies()
-        tracked_companies_list = [
-            "ADBE",
-            # "AI",
-            # "AKAM",
-            # "APPF",
-            # "APPN",
-            # "ASAN",
-            # "ASUR",
-            # "AVLR",
-            # "AYX",
-            # "BIGC",
-            # "BILL",
-            # "BL",
-            # "BLIN",
-            # "BNFT",
-            # "BOX",
-            # "BSY",
-            # "CCSI",
-            # "CDAY",
-            # "CHNG",
-            # "COUP",
-            # "CRM",
-            # "CRWD",
-            # "CTXS",
-            # "CXM",
-            # "DBX",
-            # "DCT",
-            # "DDOG",
-            # "DOCN",
-            # "DOCU",
-            # "DOMO",
-            # "DSGX",
-            # "DT",
-            # "ECOM",
-            # "ESTC",
-            # "EVBG",
-            # "FFIV",
-            # "FIVN",
-            # "FROG",
-            # "FSLY",
-            # "FSSN",
-            # "GWRE",
-            # "HUBS",
-            # "INTU",
-            # "JAMF",
-            # "MCHX",
-            # "MDB",
-            # "MIME",
-            # "MIXT",
-            # "MNDY",
-            # "MNTV",
-            # "NCNO",
-            # "NET",
-            # "NEWR",
-            # "NOW",
-            # "OKTA",
-            # "OLO",
-            # "PAYC",
-            # "PCOR",
-            # "PCTY",
-            # "PD",
-            # "PING",
-            # "PLAN",
-            # "QLYS",
-            # "QTWO",
-            # "RAMP",
-            # "RNG",
-            # "SHOP",
-            # "SMAR",
-            # "SNOW",
-            # "SPLK",
-            # "SPSC",
-            # "SPT",
-            # "SQ",
-            # "SUMO",
-            # "TEAM",
-            # "TEUM",
-            # "TWLO",
-            # "TWOU",
-            # "U",
-            # "VEEV",
-            # "VERB",
-            # "WDAY",
-            # "WIX",
-            # "WK",
-            # "XM",
-            # "YEXT",
-            # "ZEN",
-            # "ZI",
-            # "ZIP",
-            # "ZM",
-            # "ZS",
-            # "ZUO",
-        ]
-        update_tracked_companies(tracked_companies_list)
+        tickers = list(options["tickers"])
+        files = options["file"]
+        if not tickers and not files:
+            files = [DEFAULT_TICKER_FILE]
+        for path in files:
+            tickers += read_ticker_file(path)
+        diff = update_tracked_companies(tickers, untrack_others=not options["add"])
+        self.stdout.write(
+            f"Tracked {diff.tracked} companies, untracked {diff.untracked}"
+        )
+        if diff.unknown:
+            self.stderr.write(f"Unknown tickers: {', '.join(diff.unknown)}")
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.10 on 2026-10-18 06:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financials', '0021_alter_timedimension_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='checksum',
+            name='etag',
+            field=models.CharField(blank=True, max_length=255, verbose_name='ETag'),
+        ),
+        migrations.AddField(
+            model_name='checksum',
+            name='last_modified',
+            field=models.CharField(blank=True, max_length=100, verbose_name='Last-Modified'),
+        ),
+    ]
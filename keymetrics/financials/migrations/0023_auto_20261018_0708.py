@@ -0,0 +1,96 @@
+# Generated by Django 3.2.10 on 2026-10-18 07:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("financials", "0022_auto_20261018_0656"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IngestionRun",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "api_type",
+                    models.CharField(
+                        choices=[("S", "Submission API"), ("F", "Fact API")],
+                        max_length=1,
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("R", "Running"), ("F", "Finished")],
+                        default="R",
+                        max_length=1,
+                    ),
+                ),
+                ("started_at", models.DateTimeField(auto_now_add=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="IngestionRunCompany",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("P", "Pending"), ("D", "Done"), ("X", "Failed")],
+                        default="P",
+                        max_length=1,
+                    ),
+                ),
+                ("attempts", models.IntegerField(default=0)),
+                ("seconds", models.FloatField(blank=True, null=True)),
+                ("error", models.TextField(blank=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "company",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ingestion_runs",
+                        to="financials.company",
+                    ),
+                ),
+                (
+                    "run",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="companies",
+                        to="financials.ingestionrun",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "ingestion run companies",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="ingestionruncompany",
+            constraint=models.UniqueConstraint(
+                fields=("run", "company"), name="unique company per ingestion run"
+            ),
+        ),
+    ]
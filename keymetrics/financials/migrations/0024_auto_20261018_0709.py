@@ -0,0 +1,81 @@
+# Generated by Django 3.2.10 on 2026-10-18 07:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("financials", "0023_auto_20261018_0708"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IngestionJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "api_type",
+                    models.CharField(
+                        choices=[("S", "Submission API"), ("F", "Fact API")],
+                        max_length=1,
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("Q", "Queued"),
+                            ("R", "Running"),
+                            ("D", "Done"),
+                            ("X", "Failed"),
+                        ],
+                        default="Q",
+                        max_length=1,
+                    ),
+                ),
+                ("attempts", models.IntegerField(default=0)),
+                (
+                    "available_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("locked_by", models.CharField(blank=True, max_length=255)),
+                ("locked_at", models.DateTimeField(blank=True, null=True)),
+                ("error", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "company",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ingestion_jobs",
+                        to="financials.company",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="ingestionjob",
+            index=models.Index(
+                fields=["status", "available_at"], name="financials__status_6047c2_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="ingestionjob",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("status__in", ["Q", "R"])),
+                fields=("company", "api_type"),
+                name="unique active ingestion job per company",
+            ),
+        ),
+    ]
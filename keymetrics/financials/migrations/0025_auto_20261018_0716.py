@@ -0,0 +1,47 @@
+# Generated by Django 3.2.10 on 2026-10-18 07:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("financials", "0024_auto_20261018_0709"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SubmissionFile",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=255)),
+                ("filing_count", models.IntegerField(blank=True, null=True)),
+                ("filing_from", models.DateField(blank=True, null=True)),
+                ("filing_to", models.DateField(blank=True, null=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "company",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="submission_files",
+                        to="financials.company",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="submissionfile",
+            constraint=models.UniqueConstraint(
+                fields=("company", "name"), name="unique submission file per company"
+            ),
+        ),
+    ]
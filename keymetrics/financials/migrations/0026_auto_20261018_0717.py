@@ -0,0 +1,23 @@
+# Generated by Django 3.2.10 on 2026-10-18 07:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("financials", "0025_auto_20261018_0716"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="company",
+            name="submissions_watermark_accn",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name="company",
+            name="submissions_watermark_date",
+            field=models.DateField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.10 on 2026-10-18 07:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financials', '0026_auto_20261018_0717'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='checksum',
+            name='checked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
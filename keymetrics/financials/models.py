@@ -1,6 +1,7 @@
 import hashlib
 
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 
@@ -8,6 +9,9 @@ class Company(models.Model):
     name = models.CharField(max_length=255)
     CIK = models.IntegerField(unique=True)
     istracked = models.BooleanField(default=False)
+    # Newest filing seen in the recent block of the Submissions API
+    submissions_watermark_accn = models.CharField(max_length=255, blank=True)
+    submissions_watermark_date = models.DateField(null=True, blank=True)
 
     class Meta:
         verbose_name_plural = "companies"
@@ -161,6 +165,10 @@ class Checksum(models.Model):
     )
     api_type = models.CharField(choices=TYPE_CHOICES, max_length=1)
     checksum = models.CharField(max_length=100)
+    etag = models.CharField(_("ETag"), max_length=255, blank=True)
+    last_modified = models.CharField(_("Last-Modified"), max_length=100, blank=True)
+    # Time of the last response of the SEC API, changed or not
+    checked_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         constraints = [
@@ -182,3 +190,139 @@ class Checksum(models.Model):
         :return: MD5 checksum string
         """
         return hashlib.md5(data).hexdigest()
+
+
+class SubmissionFile(models.Model):
+    """
+    Extra submissions file of a Company whose filings have been saved. These files
+    hold the filings that no longer fit in the recent block and do not change, so
+    each one is only fetched once.
+    """
+
+    company = models.ForeignKey(
+        Company, on_delete=models.CASCADE, related_name="submission_files"
+    )
+    name = models.CharField(max_length=255)
+    filing_count = models.IntegerField(null=True, blank=True)
+    filing_from = models.DateField(null=True, blank=True)
+    filing_to = models.DateField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["company", "name"],
+                name="unique submission file per company",
+            )
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class IngestionRun(models.Model):
+    """
+    One run of an SEC API ingestion command over the tracked Companies. The progress
+    of each Company is recorded so an interrupted run can be resumed and the
+    Companies that failed can be retried on their own.
+    """
+
+    STATUS_RUNNING = "R"
+    STATUS_FINISHED = "F"
+
+    STATUS_CHOICES = [
+        (STATUS_RUNNING, "Running"),
+        (STATUS_FINISHED, "Finished"),
+    ]
+    api_type = models.CharField(choices=Checksum.TYPE_CHOICES, max_length=1)
+    status = models.CharField(
+        choices=STATUS_CHOICES, max_length=1, default=STATUS_RUNNING
+    )
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.get_api_type_display()} - {self.started_at:%Y-%m-%d %H:%M}"
+
+
+class IngestionRunCompany(models.Model):
+    STATUS_PENDING = "P"
+    STATUS_DONE = "D"
+    STATUS_FAILED = "X"
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_DONE, "Done"),
+        (STATUS_FAILED, "Failed"),
+    ]
+    run = models.ForeignKey(
+        IngestionRun, on_delete=models.CASCADE, related_name="companies"
+    )
+    company = models.ForeignKey(
+        Company, on_delete=models.CASCADE, related_name="ingestion_runs"
+    )
+    status = models.CharField(
+        choices=STATUS_CHOICES, max_length=1, default=STATUS_PENDING
+    )
+    attempts = models.IntegerField(default=0)
+    seconds = models.FloatField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "ingestion run companies"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["run", "company"],
+                name="unique company per ingestion run",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.company} - {self.get_status_display()}"
+
+
+class IngestionJob(models.Model):
+    """
+    Queued fetch/parse/write job for one Company and SEC API. Jobs are claimed by
+    any number of worker processes with SELECT ... FOR UPDATE SKIP LOCKED.
+    """
+
+    STATUS_QUEUED = "Q"
+    STATUS_RUNNING = "R"
+    STATUS_DONE = "D"
+    STATUS_FAILED = "X"
+
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, "Queued"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_DONE, "Done"),
+        (STATUS_FAILED, "Failed"),
+    ]
+    company = models.ForeignKey(
+        Company, on_delete=models.CASCADE, related_name="ingestion_jobs"
+    )
+    api_type = models.CharField(choices=Checksum.TYPE_CHOICES, max_length=1)
+    status = models.CharField(
+        choices=STATUS_CHOICES, max_length=1, default=STATUS_QUEUED
+    )
+    attempts = models.IntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=255, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "available_at"])]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["company", "api_type"],
+                condition=models.Q(status__in=["Q", "R"]),
+                name="unique active ingestion job per company",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.company} - {self.get_api_type_display()}"
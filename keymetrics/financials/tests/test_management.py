@@ -1,27 +1,82 @@
+import io
 import json
+import time
+import zipfile
+from datetime import date, datetime, timedelta
+from datetime import timezone as dt_timezone
+from typing import Optional
 from unittest.mock import Mock, patch
 
+import fakeredis
 import pytest
 import requests
 from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
 
+import keymetrics.financials.management.commands._bulk_archive as bulk_archive
 import keymetrics.financials.management.commands._call_sec_api as call_api
+import keymetrics.financials.management.commands._rate_limit as rate_limit
+import keymetrics.financials.management.commands._scheduler as scheduler
+from keymetrics.financials.management.commands._bulk_archive import BulkArchive
 from keymetrics.financials.management.commands._checksum_checker import checksum_checker
+from keymetrics.financials.management.commands._concurrent import map_concurrently
+from keymetrics.financials.management.commands._daemon import IngestionDaemon
+from keymetrics.financials.management.commands._ingestion_run import RunTracker
+from keymetrics.financials.management.commands._job_queue import (
+    claim_jobs,
+    complete_job,
+    enqueue_jobs,
+    fail_job,
+)
+from keymetrics.financials.management.commands._lookup_cache import LookupCache
+from keymetrics.financials.management.commands._normalize import normalize_gaap_data
+from keymetrics.financials.management.commands._periods import normalize_period
+from keymetrics.financials.management.commands._processes import shard_ciks
+from keymetrics.financials.management.commands._rate_limit import (
+    InProcessRateLimiter,
+    RedisRateLimiter,
+    SharedPacer,
+    create_rate_limiter,
+)
+from keymetrics.financials.management.commands._response_cache import ResponseCache
+from keymetrics.financials.management.commands._scheduler import (
+    POLL_NO_HISTORY,
+    poll_interval,
+    predict_next_filing,
+    schedule_companies,
+)
+from keymetrics.financials.management.commands._stream_facts import CompanyFactsStream
+from keymetrics.financials.management.commands._writers import WRITER_COPY, write_rows
+from keymetrics.financials.management.commands.load_bulk_financial_facts import (
+    load_archive as load_bulk_financial_facts,
+)
 from keymetrics.financials.management.commands.load_companies import save_company_data
 from keymetrics.financials.management.commands.load_financial_facts import (
+    fetch_sec_data,
     process_dates,
     save_new_financial_concepts,
     save_new_financial_facts,
     save_new_time_dimensions,
 )
+from keymetrics.financials.management.commands.load_submissions import (
+    save_sec_response as save_submissions_response,
+)
 from keymetrics.financials.management.commands.update_tracked_companies import (
     reset_tracked_companies,
     update_tracked_companies,
 )
 from keymetrics.financials.models import (
+    Checksum,
     Company,
+    Filing,
     FinancialConcept,
     FinancialFact,
+    IngestionJob,
+    IngestionRun,
+    IngestionRunCompany,
     Ticker,
     TimeDimension,
 )
@@ -81,11 +136,36 @@ def test_process_dates(data, expected):
     assert expected == dates
 
 
+def test_normalize_period_is_memoized():
+    """Test each distinct period is computed once and non ISO dates still parse"""
+    normalize_period.cache_clear()
+    first = normalize_period("2020-01-01", "2020-03-31")
+    assert normalize_period("2020-01-01", "2020-03-31") is first
+    assert normalize_period.cache_info().hits == 1
+    assert normalize_period("Jan 1 2020", "2020-03-31").num_months == 3
+
+
+class MockSession(requests.Session):
+    """
+    Stand-in transport for the shared SEC API session
+    """
+
+    def __init__(self, get):
+        super().__init__()
+        self._get = get
+
+    def get(self, url, **kwargs):
+        return self._get(url, **kwargs)
+
+
 class MockResponse:
     """
     Mock Response object for valid call to SEC API
     """
 
+    status_code = 200
+    headers = {"ETag": '"abc"', "Last-Modified": "Fri, 01 Jan 2021 00:00:00 GMT"}
+
     @staticmethod
     def json():
         return {"cik": "00000"}
@@ -105,31 +185,207 @@ def test_get_sec_data(monkeypatch):
     def mock_get(*args, **kwargs):
         return MockResponse()
 
-    monkeypatch.setattr(requests, "get", mock_get)
+    monkeypatch.setattr(call_api, "_session", MockSession(mock_get))
+
+    data = call_api.get_sec_data("fakeurl.com")
+    assert data is not None
+    assert data["data"] == {"cik": "00000"}
+    assert data["etag"] == '"abc"'
+
+
+def test_create_session_pools_connections():
+    """Test SEC API session reuses pooled connections and negotiates gzip"""
+    session = call_api.create_session(pool_size=4)
+    adapter = session.get_adapter("https://data.sec.gov/")
+    assert isinstance(adapter, HTTPAdapter)
+    assert adapter.poolmanager.connection_pool_kw["maxsize"] == 4
+    assert "gzip" in session.headers["Accept-Encoding"]
+    assert session.headers["User-Agent"]
 
+
+def test_get_session_is_shared_and_injectable(monkeypatch):
+    """Test the shared session is created once and can be replaced"""
+    monkeypatch.setattr(call_api, "_session", None)
+    session = call_api.get_session()
+    assert call_api.get_session() is session
+    stand_in = MockSession(lambda *args, **kwargs: MockResponse())
+    call_api.set_session(stand_in)
     data = call_api.get_sec_data("fakeurl.com")
+    assert data is not None
     assert data["data"] == {"cik": "00000"}
 
 
+def test_response_cache_evicts_least_recently_used(tmp_path):
+    """Test cached responses are content-addressed and evicted by size"""
+    cache = ResponseCache(str(tmp_path), max_bytes=10)
+    cache.put("url1", "md5-1", b"123456")
+    cache.put("url2", "md5-1", b"123456")
+    assert cache.get_path("url1") == cache.get_path("url2")
+    cache.put("url3", "md5-3", b"abcdef")
+    assert cache.get_path("url1") is None
+    cached = cache.get_path("url3")
+    assert cached is not None
+    path, checksum = cached
+    assert checksum == "md5-3"
+    assert path.read_bytes() == b"abcdef"
+
+
+def test_get_sec_data_persists_to_response_cache(monkeypatch, settings, tmp_path):
+    """Test raw responses are stored in the response cache and can be replayed"""
+    settings.SEC_RESPONSE_CACHE_DIR = str(tmp_path)
+
+    def mock_get(*args, **kwargs):
+        return MockResponse()
+
+    monkeypatch.setattr(call_api, "_session", MockSession(mock_get))
+    data = call_api.get_sec_data("fakeurl.com")
+    assert data is not None
+    replayed = call_api.replay_sec_data("fakeurl.com")
+    assert replayed == {"data": data["data"], "checksum": data["checksum"]}
+    assert call_api.replay_sec_data("otherurl.com") is None
+
+
+class MockNotModifiedResponse:
+    """
+    Mock Response object for a conditional call to SEC API with unchanged data
+    """
+
+    status_code = 304
+
+
+def test_get_sec_data_conditional_not_modified(monkeypatch):
+    """Test stored validators are sent and a 304 short-circuits the call"""
+    sent_headers = {}
+
+    def mock_get(*args, headers=None, **kwargs):
+        sent_headers.update(headers)
+        return MockNotModifiedResponse()
+
+    monkeypatch.setattr(call_api, "_session", MockSession(mock_get))
+    validators = {"etag": '"abc"', "last_modified": ""}
+    data = call_api.get_sec_data("fakeurl.com", validators=validators)
+    assert data == call_api.NOT_MODIFIED
+    assert sent_headers["If-None-Match"] == '"abc"'
+    assert "If-Modified-Since" not in sent_headers
+
+
+class MockBrokenStreamResponse:
+    """
+    Mock streamed Response whose connection drops part way through the content
+    """
+
+    status_code = 200
+    headers: dict = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    @staticmethod
+    def raise_for_status():
+        pass
+
+    @staticmethod
+    def iter_content(chunk_size=None):
+        yield b'{"cik": '
+        raise requests.exceptions.ChunkedEncodingError("Connection broken")
+
+    def close(self):
+        pass
+
+
+def test_download_sec_data_closes_file_on_failure(monkeypatch):
+    """Test the spooled temporary file is closed when the download fails"""
+    files = []
+
+    def temporary_file():
+        files.append(io.BytesIO())
+        return files[-1]
+
+    monkeypatch.setattr(call_api.tempfile, "TemporaryFile", temporary_file)
+    monkeypatch.setattr(call_api, "BACKOFF_BASE", 0)
+    monkeypatch.setattr(call_api.time, "sleep", lambda seconds: None)
+    monkeypatch.setattr(
+        call_api, "_session", MockSession(lambda *a, **kw: MockBrokenStreamResponse())
+    )
+    assert call_api.download_sec_data("fakeurl.com") is None
+    assert files and all(f.closed for f in files)
+
+
 class MockBadResponse:
     """
     Mock Response object for bad response (Error)
     """
 
+    status_code = 500
+    headers: dict = {}
+
     @staticmethod
     def raise_for_status():
         raise requests.exceptions.HTTPError("HTTP Error")
 
+    @staticmethod
+    def close():
+        pass
+
+
+class MockThrottledResponse(MockBadResponse):
+    """
+    Mock Response object for a throttled call to SEC API
+    """
+
+    status_code = 429
+    headers = {"Retry-After": "7"}
+
+
+class MockRateLimiter:
+    """
+    Stand-in rate limiter recording throttling
+    """
+
+    def __init__(self):
+        self.throttled: list[float] = []
+
+    def acquire(self):
+        pass
+
+    def throttle(self, seconds):
+        self.throttled.append(seconds)
+
 
 def test_get_sec_data_exception_handling(monkeypatch, caplog):
-    """Test error in call to SEC API"""
+    """Test error in call to SEC API after retrying"""
+    calls = []
 
     def mock_get(*args, **kwargs):
+        calls.append(kwargs["timeout"])
         return MockBadResponse()
 
-    monkeypatch.setattr(requests, "get", mock_get)
-    call_api.get_sec_data("fakeurl.com")
+    monkeypatch.setattr(call_api, "_session", MockSession(mock_get))
+    monkeypatch.setattr(call_api, "BACKOFF_BASE", 0)
+    assert call_api.get_sec_data("fakeurl.com") is None
     assert "HTTP Error" in caplog.text
+    assert len(calls) == call_api.MAX_ATTEMPTS
+    assert calls[1][1] == 2 * calls[0][1]
+
+
+def test_get_sec_data_retries_throttled_requests(monkeypatch):
+    """Test 429 responses are retried after Retry-After and slow down every worker"""
+    responses = [MockThrottledResponse(), MockResponse()]
+    delays: list[float] = []
+    rate_limiter = MockRateLimiter()
+    monkeypatch.setattr(
+        call_api, "_session", MockSession(lambda *a, **k: responses.pop(0))
+    )
+    monkeypatch.setattr(call_api.time, "sleep", delays.append)
+    monkeypatch.setattr(rate_limit, "_rate_limiter", rate_limiter)
+    data = call_api.get_sec_data("fakeurl.com")
+    assert data is not None
+    assert data["data"] == {"cik": "00000"}
+    assert delays == rate_limiter.throttled
+    assert delays[0] >= 7
 
 
 @patch("keymetrics.financials.management.commands.load_companies.get_sec_data")
@@ -167,6 +423,34 @@ def test_companies_null_name_replaced_by_ticker(mock_sec_get_data):
     assert len(null_name_replaced) == 1
 
 
+@patch("keymetrics.financials.management.commands.load_companies.get_sec_data")
+def test_load_companies_applies_universe_diff(
+    mock_sec_get_data, django_assert_max_num_queries
+):
+    """Test renamed companies and moved or delisted tickers are synced in bulk"""
+    apple = CompanyFactory(CIK=320193, name="Apple Computer")
+    other = CompanyFactory(CIK=1111111, name="Fake.ai")
+    TickerFactory(company=other, ticker="AAPL")
+    TickerFactory(company=other, ticker="GONE")
+    TickerFactory(company=other, ticker="FAKE")
+    response_data = {
+        "0": {"cik_str": 320193, "ticker": "AAPL", "title": "Apple Inc."},
+        "1": {"cik_str": 1111111, "ticker": "FAKE", "title": "Fake.ai"},
+        "2": {"cik_str": 2222222, "ticker": "NEW", "title": "New Co"},
+    }
+    mock_sec_get_data.return_value = {"data": response_data, "checksum": "checksum"}
+    with django_assert_max_num_queries(12):
+        diff = save_company_data()
+    assert diff == (1, 1, 1, 1, 1)
+    apple.refresh_from_db()
+    assert apple.name == "Apple Inc."
+    assert dict(Ticker.objects.values_list("ticker", "company__CIK")) == {
+        "AAPL": 320193,
+        "FAKE": 1111111,
+        "NEW": 2222222,
+    }
+
+
 class MockFactResponse:
     """
     Mock Response object for valid call to SEC Facts API
@@ -248,6 +532,28 @@ def test_save_new_financial_concepts_if_doesnt_exist():
     assert len(concepts) == 1
 
 
+def test_save_new_financial_concepts_bulk_inserts(django_assert_num_queries):
+    """Test new concepts are inserted in one statement and known tags are skipped"""
+    FinancialConceptFactory(tag="AccountsPayableCurrent")
+    gaap_data = MockFactResponse.json()["facts"]["us-gaap"]
+    entry = gaap_data["AccountsPayableCurrent"]["units"]["USD"][0]
+    gaap_data["Revenues"] = {
+        "label": None,
+        "description": None,
+        "units": {"USD": [dict(entry, start="2020-01-01")]},
+    }
+    cache = LookupCache()
+    # One query for the bulk insert and one for the ids of the new concepts
+    with django_assert_num_queries(2):
+        save_new_financial_concepts(gaap_data, cache=cache)
+    with django_assert_num_queries(0):
+        save_new_financial_concepts(gaap_data, cache=cache)
+    concept = FinancialConcept.objects.get(tag="Revenues")
+    assert cache.concepts["Revenues"] == concept.id
+    assert concept.name == concept.description == "Revenues"
+    assert concept.type == FinancialConcept.TYPE_PERIOD_ENDED
+
+
 def test_save_new_time_dimensions():
     """Test management command function that adds new time dimensions"""
     gaap_data = MockFactResponse.json()["facts"]["us-gaap"]
@@ -266,6 +572,36 @@ def test_save_new_time_dimensions_if_doesnt_exist():
     assert len(time_dimensions) == 1
 
 
+def test_save_new_time_dimensions_dedupes_in_one_insert(django_assert_num_queries):
+    """Test repeated periods are inserted once and known periods skip the DB"""
+    gaap_data = MockFactResponse.json()["facts"]["us-gaap"]
+    entries = gaap_data["AccountsPayableCurrent"]["units"]["USD"]
+    entries += [dict(entries[0], start="2020-01-01") for _ in range(3)]
+    # Loading the registry, the bulk insert and fetching the new ids
+    with django_assert_num_queries(3):
+        ids = save_new_time_dimensions(gaap_data)
+    with django_assert_num_queries(0):
+        save_new_time_dimensions(gaap_data)
+    assert TimeDimension.objects.count() == 2
+    assert ids["2020-01-012020-04-304"] == (
+        TimeDimension.objects.get(key="2020-01-012020-04-304").id
+    )
+
+
+def test_normalize_gaap_data_is_columnar():
+    """Test facts become index columns over the distinct values they refer to"""
+    gaap_data = MockFactResponse.json()["facts"]["us-gaap"]
+    entries = gaap_data["AccountsPayableCurrent"]["units"]["USD"]
+    entries += [dict(entries[0], val=1.5e3), dict(entries[0], form="8-K")]
+    facts = normalize_gaap_data(gaap_data)
+    assert len(facts) == 3
+    assert [c.tag for c in facts.concepts] == ["AccountsPayableCurrent"]
+    assert [p.time_key for p in facts.periods] == ["2020-04-30"]
+    assert facts.accns == ["0001111111-11-111111"]
+    assert list(facts.value) == [4726000, 1500, 4726000]
+    assert [facts.forms[i] for i in facts.form_idx] == ["10-K", "10-K", "8-K"]
+
+
 def test_save_new_financial_facts():
     gaap_data = MockFactResponse.json()["facts"]["us-gaap"]
     company = CompanyFactory(CIK=1111111, name="Fake.ai")
@@ -277,6 +613,84 @@ def test_save_new_financial_facts():
     assert len(facts) == 1
 
 
+def test_save_new_financial_facts_resolves_from_cache(django_assert_num_queries):
+    """Test facts are resolved from the lookup cache without per-row queries"""
+    gaap_data = MockFactResponse.json()["facts"]["us-gaap"]
+    company = CompanyFactory(CIK=1111111, name="Fake.ai")
+    FilingFactory(company=company, accn_num="0001111111-11-111111")
+    FinancialConceptFactory(tag="AccountsPayableCurrent")
+    TimeDimensionFactory(key="2020-04-30", end_date="2020-04-30")
+    cache = LookupCache()
+    # One query for the existing facts and one for the bulk insert
+    with django_assert_num_queries(2):
+        save_new_financial_facts(gaap_data, company, cache=cache)
+    assert FinancialFact.objects.count() == 1
+
+
+def test_save_new_financial_facts_skips_lookup_of_8k_accns(django_assert_num_queries):
+    """Test accession numbers with only 8-K facts do not cost a filing query"""
+    gaap_data = MockFactResponse.json()["facts"]["us-gaap"]
+    units = gaap_data["AccountsPayableCurrent"]["units"]["USD"]
+    units.append({**units[0], "accn": "0001111111-22-222222", "form": "8-K"})
+    company = CompanyFactory(CIK=1111111, name="Fake.ai")
+    FilingFactory(company=company, accn_num="0001111111-11-111111")
+    FinancialConceptFactory(tag="AccountsPayableCurrent")
+    TimeDimensionFactory(key="2020-04-30", end_date="2020-04-30")
+    cache = LookupCache()
+    with django_assert_num_queries(2):
+        save_new_financial_facts(gaap_data, company, cache=cache)
+    assert FinancialFact.objects.count() == 1
+
+
+def test_lookup_cache_adds_new_rows():
+    """Test rows created after the cache is loaded are added on request"""
+    cache = LookupCache()
+    concept = FinancialConceptFactory(tag="AccountsPayableCurrent")
+    period = TimeDimensionFactory(key="2020-04-30", end_date="2020-04-30")
+    filing = FilingFactory(accn_num="0001111111-11-111111")
+    assert cache.concept_id("AccountsPayableCurrent") == concept.id
+    assert cache.period_id("2020-04-30") == period.id
+    assert cache.filing_id("0001111111-11-111111", filing.company_id) == filing.id
+    assert cache.filing_id("0000000000-00-000000", filing.company_id) is None
+    # Filings of another company are not linked
+    other = CompanyFactory()
+    assert cache.filing_id("0001111111-11-111111", other.id) is None
+
+
+def test_lookup_cache_refresh_loads_new_rows(django_assert_num_queries):
+    """Test a refresh only loads the rows created since the cache was loaded"""
+    FilingFactory(accn_num="0001111111-11-111111")
+    cache = LookupCache()
+    concept = FinancialConceptFactory(tag="AccountsPayableCurrent")
+    period = TimeDimensionFactory(key="2020-04-30", end_date="2020-04-30")
+    filing = FilingFactory(accn_num="0001111111-22-222222")
+    # New rows and the row count of each table
+    with django_assert_num_queries(6) as captured:
+        cache.refresh()
+    assert all(
+        '"id" >' in query["sql"] or "COUNT(*)" in query["sql"]
+        for query in captured.captured_queries
+    )
+    assert cache.concepts == {concept.tag: concept.id}
+    assert cache.period_id(period.key) == period.id
+    assert cache.filings[(filing.company_id, filing.accn_num)] == filing.id
+    assert len(cache.filings) == 2
+
+
+def test_lookup_cache_refresh_drops_deleted_rows():
+    """Test rows deleted and recreated by another process are picked up on refresh"""
+    filing = FilingFactory(accn_num="0001111111-11-111111")
+    concept = FinancialConceptFactory(tag="AccountsPayableCurrent")
+    cache = LookupCache()
+    assert cache.filing_id(filing.accn_num, filing.company_id) == filing.id
+    call_command("delete_financial_facts")
+    concept.delete()
+    new_filing = FilingFactory(company=filing.company, accn_num=filing.accn_num)
+    cache.refresh()
+    assert cache.filing_id(filing.accn_num, filing.company_id) == new_filing.id
+    assert "AccountsPayableCurrent" not in cache.concepts
+
+
 @patch("keymetrics.financials.management.commands.load_financial_facts.get_sec_data")
 def test_load_financial_facts_command(mock_sec_get_data: Mock):
     """Test entire financial fact management command (Loads TimeDimensions,
@@ -291,6 +705,596 @@ def test_load_financial_facts_command(mock_sec_get_data: Mock):
     assert facts[0].value == 4726000
 
 
+@patch("keymetrics.financials.management.commands.load_financial_facts.get_sec_data")
+def test_load_financial_facts_command_concurrent_workers(mock_sec_get_data: Mock):
+    """Test financial fact management command with concurrent SEC API downloads"""
+    response_data = MockFactResponse.json()
+    company = CompanyFactory(CIK=1111111, name="Fake.ai")
+    FilingFactory(company=company, accn_num="0001111111-11-111111")
+    mock_sec_get_data.return_value = {"data": response_data, "checksum": "checksum"}
+    call_command("load_financial_facts", workers=4)
+    assert FinancialFact.objects.count() == 1
+
+
+@patch("keymetrics.financials.management.commands.load_financial_facts.get_sec_data")
+def test_load_financial_facts_command_retry_list(mock_sec_get_data: Mock):
+    """Test companies failing after retries are retried at the end of the run"""
+    response_data = MockFactResponse.json()
+    company = CompanyFactory(CIK=1111111, name="Fake.ai")
+    FilingFactory(company=company, accn_num="0001111111-11-111111")
+    other = CompanyFactory(CIK=2222222)
+    responses: dict[str, list[Optional[dict]]] = {
+        company.sec_facts_url: [None, {"data": response_data, "checksum": "checksum"}],
+        other.sec_facts_url: [None, None],
+    }
+    mock_sec_get_data.side_effect = lambda url, validators: responses[url].pop(0)
+    failed = fetch_sec_data()
+    assert failed == [other]
+    assert FinancialFact.objects.count() == 1
+
+
+@patch("keymetrics.financials.management.commands.load_financial_facts.get_sec_data")
+def test_load_financial_facts_command_dead_letter_retry(mock_sec_get_data: Mock):
+    """Test failed companies are recorded and can be retried on their own"""
+    response_data = MockFactResponse.json()
+    company = CompanyFactory(CIK=1111111, name="Fake.ai")
+    FilingFactory(company=company, accn_num="0001111111-11-111111")
+    other = CompanyFactory(CIK=2222222)
+    mock_sec_get_data.side_effect = lambda url, validators: (
+        {"data": response_data, "checksum": "checksum"}
+        if url == company.sec_facts_url
+        else None
+    )
+    call_command("load_financial_facts")
+    run = IngestionRun.objects.get()
+    assert run.status == IngestionRun.STATUS_FINISHED
+    dead_letter = run.companies.get(status=IngestionRunCompany.STATUS_FAILED)
+    assert dead_letter.company == other
+    assert dead_letter.error
+
+    mock_sec_get_data.reset_mock()
+    call_command("load_financial_facts", retry_failed=True)
+    assert [c.args[0] for c in mock_sec_get_data.call_args_list] == [
+        other.sec_facts_url
+    ] * 2
+    assert IngestionRun.objects.count() == 1
+    assert run.companies.get(company=other).attempts == 2
+
+
+@patch("keymetrics.financials.management.commands.load_financial_facts.get_sec_data")
+def test_load_financial_facts_command_resume(mock_sec_get_data: Mock):
+    """Test resuming an interrupted run skips the companies it already finished"""
+    company = CompanyFactory(CIK=1111111, name="Fake.ai")
+    other = CompanyFactory(CIK=2222222)
+    tracker = RunTracker.start(Checksum.TYPE_FACTS)
+    assert tracker is not None
+    tracker.done(company)
+    mock_sec_get_data.return_value = call_api.NOT_MODIFIED
+    call_command("load_financial_facts", resume=True)
+    mock_sec_get_data.assert_called_once_with(other.sec_facts_url, None)
+    tracker.run.refresh_from_db()
+    assert tracker.run.status == IngestionRun.STATUS_FINISHED
+
+
+def test_shard_ciks_is_stable():
+    """Test companies are split across processes by CIK"""
+    assert shard_ciks([5, 2, 3, 4], 2) == [[2, 4], [3, 5]]
+    assert shard_ciks([4], 3) == [[4]]
+
+
+def test_shared_pacer_spaces_requests():
+    """Test the cross-process rate limit spaces requests by the rate interval"""
+    pacer = SharedPacer(rate=100)
+    start = time.time()
+    for _ in range(6):
+        pacer.acquire()
+    assert time.time() - start >= 0.05
+
+
+class FakeClock:
+    """Clock for the rate limiters whose sleeps advance it instead of waiting"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_shared_pacer_backs_off_after_throttling(monkeypatch):
+    """Test a throttle lowers the shared rate and it recovers over time"""
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit, "time", clock)
+    pacer = SharedPacer(rate=10)
+
+    def elapsed(requests):
+        start = clock.now
+        for _ in range(requests):
+            pacer.acquire()
+        return clock.now - start
+
+    assert elapsed(6) == pytest.approx(0.5)
+    pacer.throttle(0)
+    assert pacer.current_rate() == pytest.approx(5)
+    # The slot reserved before the throttle, then five at half the rate
+    assert elapsed(6) == pytest.approx(1.1, abs=0.01)
+    clock.sleep(rate_limit.RECOVERY_SECONDS)
+    assert pacer.current_rate() == 10
+    elapsed(1)
+    assert elapsed(6) == pytest.approx(0.6)
+
+
+def test_in_process_rate_limiter_backs_off_after_throttling(monkeypatch):
+    """Test repeated throttles keep lowering the rate down to its minimum"""
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit, "time", clock)
+    limiter = InProcessRateLimiter(rate=10)
+    limiter.throttle(0)
+    assert limiter.current_rate() == pytest.approx(5)
+    limiter.throttle(0)
+    assert limiter.current_rate() == pytest.approx(2.5)
+    for _ in range(5):
+        limiter.throttle(0)
+    assert limiter.current_rate() == pytest.approx(10 * rate_limit.MIN_RATE_FRACTION)
+    clock.sleep(rate_limit.RECOVERY_SECONDS / 2)
+    assert limiter.current_rate() == pytest.approx(6)
+
+
+def test_redis_rate_limiter_backs_off_after_throttling():
+    """Test a throttle lowers the rate shared through Redis"""
+    server = fakeredis.FakeServer()
+    limiters = [
+        RedisRateLimiter(fakeredis.FakeRedis(server=server), rate=50) for _ in range(2)
+    ]
+    limiters[0].throttle(0)
+    assert limiters[1].current_rate() == pytest.approx(25, abs=0.1)
+    start = time.time()
+    for _ in range(3):
+        for limiter in limiters:
+            limiter.acquire()
+    # Five slots at about half the rate, the full rate would take 0.1 seconds
+    assert time.time() - start >= 0.15
+
+
+def test_redis_rate_limiter_shares_budget_across_processes():
+    """Test limiters on the same Redis share one budget and count the requests"""
+    server = fakeredis.FakeServer()
+    limiters = [
+        RedisRateLimiter(fakeredis.FakeRedis(server=server), rate=50) for _ in range(2)
+    ]
+    start = time.time()
+    for _ in range(3):
+        for limiter in limiters:
+            limiter.acquire()
+    assert time.time() - start >= 0.1
+    assert sum(limiters[0].requests_per_minute().values()) == 6
+
+
+def test_log_requests_per_minute(monkeypatch, caplog):
+    """Test the requests counted in Redis are logged against the per minute budget"""
+    limiter = RedisRateLimiter(fakeredis.FakeRedis(), rate=50)
+    monkeypatch.setattr(rate_limit, "_rate_limiter", limiter)
+    for _ in range(3):
+        limiter.acquire()
+    with caplog.at_level("INFO"):
+        rate_limit.log_requests_per_minute(minutes=2)
+    message, counts = caplog.messages[-1].split(": ")
+    assert message == "SEC requests per minute (of 3000) in the last 2"
+    assert sum(map(int, counts.split(", "))) == 3
+
+
+def test_redis_rate_limiter_falls_back_in_process(caplog):
+    """Test requests are still limited in-process when Redis is unreachable"""
+    server = fakeredis.FakeServer()
+    server.connected = False
+    limiter = RedisRateLimiter(fakeredis.FakeRedis(server=server))
+    limiter.acquire()
+    limiter.acquire()
+    assert caplog.text.count("Redis rate limit unavailable") == 1
+
+
+def test_create_rate_limiter_without_redis(settings):
+    """Test the in-process limiter is used when no Redis is configured"""
+    settings.SEC_RATE_LIMIT_REDIS_URL = ""
+    assert isinstance(create_rate_limiter(), InProcessRateLimiter)
+
+
+def company_facts_response(url, validators=None):
+    """Company facts for the company whose CIK is in the SEC API URL"""
+    cik = int(url.split("CIK")[1][:10])
+    response_data = MockFactResponse.json()
+    response_data["cik"] = cik
+    us_gaap = response_data["facts"]["us-gaap"]
+    us_gaap["AccountsPayableCurrent"]["units"]["USD"][0]["accn"] = f"{cik}-11"
+    return {"data": response_data, "checksum": str(cik)}
+
+
+@pytest.mark.django_db(transaction=True)
+@patch(
+    "keymetrics.financials.management.commands.load_financial_facts.get_sec_data",
+    company_facts_response,
+)
+def test_load_financial_facts_command_processes():
+    """Test sharding companies across processes gives the same facts as serially"""
+    for cik in range(1, 6):
+        company = CompanyFactory(CIK=cik)
+        FilingFactory(company=company, accn_num=f"{cik}-11")
+    call_command("load_financial_facts", processes=3)
+    assert FinancialFact.objects.count() == 5
+    assert FinancialConcept.objects.count() == 1
+    assert TimeDimension.objects.count() == 1
+
+
+@pytest.mark.django_db(transaction=True)
+@patch(
+    "keymetrics.financials.management.commands.load_financial_facts.get_sec_data",
+    company_facts_response,
+)
+def test_fetch_sec_data_reloads_cache_after_failed_company():
+    """Test a rolled back Company does not leave ids of missing rows in the cache"""
+    for cik in (1, 2):
+        company = CompanyFactory(CIK=cik)
+        FilingFactory(company=company, accn_num=f"{cik}-11")
+    calls = []
+
+    def fail_first(*args, **kwargs):
+        calls.append(kwargs["company"])
+        if len(calls) == 1:
+            raise ValueError("Broken facts")
+        return save_new_financial_facts(*args, **kwargs)
+
+    with patch(
+        "keymetrics.financials.management.commands.load_financial_facts."
+        "save_new_financial_facts",
+        fail_first,
+    ):
+        failed = fetch_sec_data()
+    assert failed == calls[:1]
+    assert FinancialFact.objects.get().company == calls[1]
+    assert FinancialConcept.objects.count() == 1
+
+
+def test_enqueue_ingestion_jobs_skips_active_jobs():
+    """Test companies with a queued job are not queued twice"""
+    CompanyFactory(CIK=1111111)
+    CompanyFactory(CIK=2222222, istracked=False)
+    assert enqueue_jobs([Checksum.TYPE_FACTS]) == 1
+    assert enqueue_jobs([Checksum.TYPE_FACTS, Checksum.TYPE_SUBMISSIONS]) == 1
+    assert IngestionJob.objects.count() == 2
+
+
+def test_enqueue_ingestion_jobs_counts_inserted_jobs():
+    """Test only the jobs actually inserted are counted, not running or done ones"""
+    companies = [CompanyFactory(CIK=cik) for cik in (1111111, 2222222, 3333333)]
+    assert enqueue_jobs([Checksum.TYPE_FACTS], companies[:2]) == 2
+    running, done = claim_jobs(limit=2)
+    complete_job(done)
+    assert enqueue_jobs([Checksum.TYPE_FACTS], companies) == 2
+    assert IngestionJob.objects.filter(status=IngestionJob.STATUS_QUEUED).count() == 2
+    assert enqueue_jobs([Checksum.TYPE_FACTS], []) == 0
+
+
+def test_claim_jobs_only_locks_job_rows():
+    """Test claiming jobs does not lock the Companies joined to them"""
+    CompanyFactory(CIK=1111111)
+    enqueue_jobs([Checksum.TYPE_FACTS, Checksum.TYPE_SUBMISSIONS])
+    with CaptureQueriesContext(connection) as captured:
+        assert len(claim_jobs(limit=2)) == 2
+    lock = f'FOR UPDATE OF "{IngestionJob._meta.db_table}" SKIP LOCKED'
+    assert any(lock in query["sql"] for query in captured.captured_queries)
+
+
+def test_stale_worker_does_not_overwrite_reclaimed_job():
+    """Test a worker whose stale job was claimed again cannot record its outcome"""
+    CompanyFactory(CIK=1111111)
+    enqueue_jobs([Checksum.TYPE_FACTS])
+    (stale,) = claim_jobs(worker="stale")
+    IngestionJob.objects.update(
+        locked_at=datetime.now(dt_timezone.utc) - timedelta(hours=2)
+    )
+    (job,) = claim_jobs(worker="new")
+    assert not complete_job(stale)
+    assert not fail_job(stale, "Timed out")
+    job.refresh_from_db()
+    assert (job.status, job.locked_by) == (IngestionJob.STATUS_RUNNING, "new")
+    assert complete_job(job)
+
+
+@patch("keymetrics.financials.management.commands._job_queue.get_sec_data")
+def test_run_ingestion_worker(mock_sec_get_data: Mock):
+    """Test a worker claims queued jobs, saves their data and requeues failures"""
+    company = CompanyFactory(CIK=1111111)
+    FilingFactory(company=company, accn_num="1111111-11")
+    other = CompanyFactory(CIK=2222222)
+    mock_sec_get_data.side_effect = lambda url, validators: (
+        company_facts_response(url) if url == company.sec_facts_url else None
+    )
+    call_command("enqueue_ingestion_jobs", type="facts")
+    call_command("run_ingestion_worker", exit_when_empty=True)
+    assert FinancialFact.objects.get().company == company
+    assert IngestionJob.objects.get(company=company).status == IngestionJob.STATUS_DONE
+    job = IngestionJob.objects.get(company=other)
+    assert job.status == IngestionJob.STATUS_QUEUED
+    assert job.attempts == 1
+    assert claim_jobs() == []
+
+
+@patch("keymetrics.financials.management.commands._job_queue.get_sec_data")
+def test_run_ingestion_worker_saves_submissions_before_facts(mock_sec_get_data: Mock):
+    """Test facts can refer to a filing saved by a submissions job of the same batch"""
+    company = CompanyFactory(CIK=1111111)
+    submissions = {
+        "data": {
+            "cik": company.CIK,
+            "filings": {"recent": submissions_data(["1111111-11"]), "files": []},
+        },
+        "checksum": "checksum",
+    }
+    mock_sec_get_data.side_effect = lambda url, validators: (
+        company_facts_response(url) if url == company.sec_facts_url else submissions
+    )
+    enqueue_jobs([Checksum.TYPE_FACTS])
+    enqueue_jobs([Checksum.TYPE_SUBMISSIONS])
+    call_command("run_ingestion_worker", exit_when_empty=True)
+    assert FinancialFact.objects.get().filing.accn_num == "1111111-11"
+
+
+@patch("keymetrics.financials.management.commands.load_financial_facts.get_sec_data")
+def test_run_ingestion_daemon_keeps_cache_warm(mock_sec_get_data: Mock, tmp_path):
+    """Test the daemon reuses its lookup cache and reports the timing of each cycle"""
+    company = CompanyFactory(CIK=1111111)
+    FilingFactory(company=company, accn_num="1111111-11")
+    responses = [company_facts_response(company.sec_facts_url), {"not_modified": True}]
+    mock_sec_get_data.side_effect = lambda url, validators: responses.pop(0)
+    status_file = tmp_path / "status.json"
+    daemon = IngestionDaemon([Checksum.TYPE_FACTS], status_file=str(status_file))
+    daemon.run_cycle()
+    cache = daemon.cache
+    assert cache is not None
+    daemon.run_cycle()
+    assert daemon.cache is cache
+    assert list(cache.companies) == [company.CIK]
+    assert FinancialFact.objects.count() == 1
+    assert IngestionRun.objects.count() == 1
+    assert IngestionRunCompany.objects.count() == 1
+    timings = json.loads(status_file.read_text())
+    assert [t["api_type"] for t in timings] == [Checksum.TYPE_FACTS] * 2
+    assert all(t["failed"] == 0 for t in timings)
+
+
+def test_predict_next_filing_from_cadence_and_lag():
+    """Test the next filing is one reporting period plus the usual lag away"""
+    filings = [
+        (date(2026, 3, 31), date(2026, 5, 10)),
+        (date(2026, 6, 30), date(2026, 8, 9)),
+    ]
+    today = date(2026, 10, 18)
+    expected = predict_next_filing(filings, today)
+    assert expected == date(2026, 11, 8)
+    assert poll_interval(expected, today) == scheduler.POLL_NEAR
+    assert poll_interval(expected, date(2026, 11, 1)) == scheduler.POLL_IN_WINDOW
+    assert poll_interval(expected, date(2026, 7, 1)) == scheduler.POLL_DORMANT
+    # A missed filing rolls forward to the next window
+    rolled = predict_next_filing(filings, date(2027, 3, 1))
+    assert rolled is not None and rolled > date(2027, 2, 7)
+
+
+def test_schedule_companies_under_budget():
+    """Test companies in their filing window are polled before new ones, dormant ones wait"""
+    now = datetime(2026, 11, 5, tzinfo=dt_timezone.utc)
+    in_window = CompanyFactory(CIK=1111111)
+    dormant = CompanyFactory(CIK=2222222)
+    new = CompanyFactory(CIK=3333333)
+    for report_date in [date(2026, 3, 31), date(2026, 6, 30)]:
+        FilingFactory(
+            company=in_window,
+            type="10-Q",
+            report_date=report_date,
+            date_filed=report_date + timedelta(days=40),
+        )
+    for report_date in [date(2026, 6, 30), date(2026, 9, 30)]:
+        FilingFactory(
+            company=dormant,
+            type="10-Q",
+            report_date=report_date,
+            date_filed=report_date + timedelta(days=5),
+        )
+    for company in (in_window, dormant):
+        Checksum.objects.create(
+            company=company,
+            api_type=Checksum.TYPE_FACTS,
+            checksum="checksum",
+            checked_at=now - timedelta(days=2),
+        )
+    assert schedule_companies([Checksum.TYPE_FACTS], now=now) == [in_window, new]
+    assert schedule_companies([Checksum.TYPE_FACTS], budget=1, now=now) == [in_window]
+
+
+@patch("keymetrics.financials.management.commands.load_financial_facts.get_sec_data")
+def test_schedule_companies_counts_polls_of_every_command(mock_sec_get_data: Mock):
+    """Test a poll by load_financial_facts, even if not modified, defers the next one"""
+    company = CompanyFactory(CIK=1111111)
+    # No periodic filing history, so the company is polled daily
+    FilingFactory(company=company, accn_num="1111111-11", type="10-K/A")
+    responses = [company_facts_response(company.sec_facts_url), {"not_modified": True}]
+    mock_sec_get_data.side_effect = lambda url, validators: responses.pop(0)
+    fetch_sec_data()
+    polled = Checksum.objects.get(company=company).checked_at
+    assert polled is not None
+    assert schedule_companies([Checksum.TYPE_FACTS]) == []
+    fetch_sec_data()
+    repolled = Checksum.objects.get(company=company).checked_at
+    assert repolled is not None and repolled > polled
+    later = timezone.now() + POLL_NO_HISTORY + timedelta(minutes=1)
+    assert schedule_companies([Checksum.TYPE_FACTS], now=later) == [company]
+
+
+def stale_fact(company: Company, accn_num: str) -> FinancialFact:
+    return FinancialFact.objects.create(
+        company=company,
+        filing=FilingFactory(company=company, accn_num=accn_num),
+        concept=FinancialConceptFactory(),
+        period=TimeDimensionFactory(key=accn_num),
+        value=1,
+    )
+
+
+def test_delete_financial_facts_by_cik_in_chunks():
+    """Test a scoped purge only deletes the data of the given companies"""
+    company = CompanyFactory(CIK=1111111)
+    other = CompanyFactory(CIK=2222222)
+    for i in range(3):
+        stale_fact(company, f"1111111-{i}")
+    stale_fact(other, "2222222-0")
+    ChecksumFactory(company=company, api_type=Checksum.TYPE_FACTS)
+    call_command("delete_financial_facts", cik=[company.CIK], chunk_size=2)
+    assert list(FinancialFact.objects.values_list("company", flat=True)) == [other.id]
+    assert list(Filing.objects.values_list("company", flat=True)) == [other.id]
+    assert not Checksum.objects.exists()
+
+    call_command("delete_financial_facts")
+    assert not FinancialFact.objects.exists()
+    assert not Filing.objects.exists()
+
+
+@patch("keymetrics.financials.management.commands.reload_company_facts.get_sec_data")
+def test_reload_company_facts(mock_sec_get_data: Mock):
+    """Test reloading a company swaps its facts for the ones from the SEC API"""
+    company = CompanyFactory(CIK=1111111)
+    FilingFactory(company=company, accn_num="1111111-11")
+    stale = stale_fact(company, "1111111-0")
+    mock_sec_get_data.side_effect = company_facts_response
+    call_command("reload_company_facts", company.CIK)
+    fact = FinancialFact.objects.get()
+    assert fact != stale
+    assert fact.filing.accn_num == "1111111-11"
+    assert Checksum.objects.get(company=company).checksum == str(company.CIK)
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_map_concurrently_returns_every_result(workers):
+    """Test every item is processed exactly once regardless of worker count"""
+    results = dict(map_concurrently(lambda x: x * 2, range(20), workers=workers))
+    assert results == {x: x * 2 for x in range(20)}
+
+
+@patch("keymetrics.financials.management.commands.load_financial_facts.get_sec_data")
+def test_load_financial_facts_command_copy_writer(mock_sec_get_data: Mock):
+    """Test financial fact management command using the COPY writer"""
+    response_data = MockFactResponse.json()
+    company = CompanyFactory(CIK=1111111, name="Fake.ai")
+    FilingFactory(company=company, accn_num="0001111111-11-111111")
+    mock_sec_get_data.return_value = {"data": response_data, "checksum": "checksum"}
+    call_command("load_financial_facts", writer=WRITER_COPY)
+    facts = FinancialFact.objects.all()
+    assert len(facts) == 1
+    assert facts[0].value == 4726000
+
+
+def test_copy_writer_ignores_conflicts():
+    """Test COPY writer skips rows that conflict with existing rows"""
+    company = CompanyFactory()
+    rows = [
+        (company.id, "10-K", "0001111111-11-000001", "2020-12-31", "2021-01-01"),
+        (company.id, "10-Q", "0001111111-11-000002", "2020-09-30", "2020-11-01"),
+    ]
+    fields = ["company_id", "type", "accn_num", "report_date", "date_filed"]
+    write_rows(Filing, fields, rows[:1], writer=WRITER_COPY)
+    write_rows(Filing, fields, rows, writer=WRITER_COPY)
+    assert Filing.objects.filter(company=company).count() == 2
+
+
+def test_copy_writer_keeps_regular_table_named_like_staging():
+    """Test only the temporary staging table is dropped, never a regular table"""
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        cursor.execute("CREATE TABLE financials_filing_staging (id integer)")
+    company = CompanyFactory()
+    for accn in ["1", "2"]:
+        write_rows(
+            Filing,
+            ["company_id", "type", "accn_num", "report_date", "date_filed"],
+            [(company.id, "10-K", accn, "2020-12-31", "2021-01-01")],
+            writer=WRITER_COPY,
+        )
+    assert Filing.objects.count() == 2
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass('public.financials_filing_staging')")
+        assert cursor.fetchone()[0] is not None
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 65536])
+def test_company_facts_stream_matches_json(chunk_size):
+    """Test streamed us-gaap batches match the fully parsed payload"""
+    response_data = MockFactResponse.json()
+    response_data["facts"]["us-gaap"]["AccountsReceivable"] = {
+        "label": "Accounts Receivable",
+        "description": 'Unicode \u00e9 and escaped " quote',
+        "units": {"USD": [{"end": "2020-04-30", "val": 1.5e3, "accn": "1"}]},
+    }
+    file = io.BytesIO(json.dumps(response_data, indent=2).encode("UTF-8"))
+    stream = CompanyFactsStream(file, chunk_size=chunk_size)
+    assert stream.read_header() == {"cik": 1111111, "entityName": "Fake.ai"}
+    batches = list(stream.iter_us_gaap(batch_size=1))
+    assert len(batches) == 2
+    streamed = {k: v for batch in batches for k, v in batch.items()}
+    assert streamed == response_data["facts"]["us-gaap"]
+
+
+@patch(
+    "keymetrics.financials.management.commands.load_financial_facts.download_sec_data"
+)
+def test_load_financial_facts_command_stream(mock_download_sec_data: Mock):
+    """Test financial fact management command in streaming mode"""
+    content = json.dumps(MockFactResponse.json()).encode("UTF-8")
+    company = CompanyFactory(CIK=1111111, name="Fake.ai")
+    FilingFactory(company=company, accn_num="0001111111-11-111111")
+    mock_download_sec_data.return_value = {
+        "file": io.BytesIO(content),
+        "checksum": "checksum",
+    }
+    call_command("load_financial_facts", stream=True)
+    facts = FinancialFact.objects.all()
+    assert len(facts) == 1
+    assert facts[0].value == 4726000
+
+
+@pytest.mark.parametrize("stream", [False, True])
+@pytest.mark.parametrize("incremental,expected", [(False, 1), (True, 2)])
+@patch(
+    "keymetrics.financials.management.commands.load_financial_facts.download_sec_data"
+)
+@patch("keymetrics.financials.management.commands.load_financial_facts.get_sec_data")
+def test_load_financial_facts_command_incremental(
+    mock_sec_get_data: Mock,
+    mock_download_sec_data: Mock,
+    stream,
+    incremental,
+    expected,
+):
+    """Test incremental mode adds new facts to filings that already have facts"""
+    response_data = MockFactResponse.json()
+    company = CompanyFactory(CIK=1111111, name="Fake.ai")
+    FilingFactory(company=company, accn_num="0001111111-11-111111")
+    mock_sec_get_data.return_value = {"data": response_data, "checksum": "first"}
+    call_command("load_financial_facts")
+
+    entries = response_data["facts"]["us-gaap"]["AccountsPayableCurrent"]["units"]
+    new_entry = dict(entries["USD"][0], end="2020-07-31", val=5000000)
+    entries["USD"] += [new_entry, new_entry]
+    mock_sec_get_data.return_value = {"data": response_data, "checksum": "second"}
+    mock_download_sec_data.return_value = {
+        "file": io.BytesIO(json.dumps(response_data).encode("UTF-8")),
+        "checksum": "second",
+    }
+    call_command("load_financial_facts", stream=stream, incremental=incremental)
+    assert FinancialFact.objects.count() == expected
+
+
 @patch("keymetrics.financials.management.commands.load_financial_facts.get_sec_data")
 def test_load_financial_facts_command_doesnt_add_new_if_checksum_matches(
     mock_sec_get_data: Mock,
@@ -307,6 +1311,47 @@ def test_load_financial_facts_command_doesnt_add_new_if_checksum_matches(
     assert len(facts) == 0
 
 
+@patch("keymetrics.financials.management.commands.load_financial_facts.get_sec_data")
+def test_load_financial_facts_command_sends_stored_validators(mock_sec_get_data: Mock):
+    """Test validators are stored and a not modified response skips the Company"""
+    response_data = MockFactResponse.json()
+    company = CompanyFactory(CIK=1111111, name="Fake.ai")
+    FilingFactory(company=company, accn_num="0001111111-11-111111")
+    mock_sec_get_data.return_value = {
+        "data": response_data,
+        "checksum": "checksum",
+        "etag": '"abc"',
+        "last_modified": "",
+    }
+    call_command("load_financial_facts")
+    assert company.checksums.get().etag == '"abc"'
+
+    FinancialFact.objects.all().delete()
+    mock_sec_get_data.return_value = call_api.NOT_MODIFIED
+    call_command("load_financial_facts")
+    mock_sec_get_data.assert_called_with(
+        company.sec_facts_url, {"etag": '"abc"', "last_modified": ""}
+    )
+    assert FinancialFact.objects.count() == 0
+
+
+def test_load_financial_facts_command_replay(settings, tmp_path):
+    """Test replay re-processes cached responses even if the checksum matches"""
+    settings.SEC_RESPONSE_CACHE_DIR = str(tmp_path)
+    content = json.dumps(MockFactResponse.json()).encode("UTF-8")
+    company = CompanyFactory(CIK=1111111, name="Fake.ai")
+    FilingFactory(company=company, accn_num="0001111111-11-111111")
+    ChecksumFactory(company=company, api_type="F", checksum="newer", etag='"abc"')
+    ResponseCache(str(tmp_path), 1024 * 1024).put(
+        company.sec_facts_url, "abc123", content
+    )
+    call_command("load_financial_facts", replay=True)
+    assert FinancialFact.objects.count() == 1
+    # The stored checksum and validators of the live data are left alone
+    checksum = Checksum.objects.get(company=company)
+    assert (checksum.checksum, checksum.etag) == ("newer", '"abc"')
+
+
 def test_reset_tracked_companies(company: Company):
     """Test management command for resetting tracked companies"""
     tracked_companies = Company.objects.filter(istracked=True)
@@ -331,6 +1376,29 @@ def test_update_tracked_companies():
     assert tracked_companies[0] == company1
 
 
+def test_update_tracked_companies_command_applies_diff(tmp_path):
+    """Test only the changed companies are updated and unknown tickers are reported"""
+    kept = CompanyFactory(istracked=True)
+    dropped = CompanyFactory(istracked=True)
+    added = CompanyFactory(istracked=False)
+    TickerFactory(company=kept, ticker="KEEP")
+    TickerFactory(company=dropped, ticker="DROP")
+    TickerFactory(company=added, ticker="ADD")
+    ticker_file = tmp_path / "tickers.txt"
+    ticker_file.write_text("# watch list\nKEEP\n\nNOPE  # delisted\n")
+    out, err = io.StringIO(), io.StringIO()
+    call_command(
+        "update_tracked_companies",
+        "ADD",
+        file=[str(ticker_file)],
+        stdout=out,
+        stderr=err,
+    )
+    assert set(Company.objects.filter(istracked=True)) == {kept, added}
+    assert "Tracked 1 companies, untracked 1" in out.getvalue()
+    assert "NOPE" in err.getvalue()
+
+
 def test_checksum_checker_returns_true_if_match():
     company = CompanyFactory(CIK=1111111, name="Fake.ai")
     FilingFactory(company=company, accn_num="0001111111-11-111111")
@@ -351,3 +1419,191 @@ def test_checksum_checker_returns_false_if_no_match():
         current_checksum=current_checksum, company=company, api_type="F"
     )
     assert match is False
+
+
+def submissions_data(accn_list: list[str]) -> dict:
+    """Columnar filing data in the format of the SEC Submissions API"""
+    return {
+        "accessionNumber": accn_list,
+        "filingDate": ["2021-01-01"] * len(accn_list),
+        "reportDate": ["2020-12-31"] * len(accn_list),
+        "form": ["10-K"] * len(accn_list),
+    }
+
+
+def test_load_bulk_financial_facts(tmp_path):
+    """Test financial facts are loaded from a companyfacts.zip archive"""
+    company = CompanyFactory(CIK=1111111, name="Fake.ai")
+    FilingFactory(company=company, accn_num="0001111111-11-111111")
+    path = tmp_path / "companyfacts.zip"
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("CIK0001111111.json", json.dumps(MockFactResponse.json()))
+        archive.writestr("CIK0002222222.json", json.dumps({"cik": 2222222}))
+    call_command("load_bulk_financial_facts", str(path), workers=2)
+    facts = FinancialFact.objects.all()
+    assert len(facts) == 1
+    assert facts[0].value == 4726000
+
+
+def test_load_bulk_financial_facts_skips_broken_members(tmp_path):
+    """Test broken archive members are skipped without committing their checksum"""
+    company = CompanyFactory(CIK=1111111, name="Fake.ai")
+    FilingFactory(company=company, accn_num="0001111111-11-111111")
+    broken = CompanyFactory(CIK=3333333)
+    CompanyFactory(CIK=2222222)
+    bad_facts = {"AccountsPayableCurrent": {"units": {"USD": [{"accn": "1"}]}}}
+    path = tmp_path / "companyfacts.zip"
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("CIK0001111111.json", json.dumps(MockFactResponse.json()))
+        archive.writestr("CIK0002222222.json", "{not json")
+        archive.writestr(
+            "CIK0003333333.json",
+            json.dumps({"cik": 3333333, "facts": {"us-gaap": bad_facts}}),
+        )
+    failed = load_bulk_financial_facts(str(path), workers=2)
+    assert sorted(failed) == ["CIK0002222222.json", "CIK0003333333.json"]
+    assert FinancialFact.objects.get().company == company
+    assert not Checksum.objects.filter(company=broken).exists()
+
+
+def test_bulk_archive_closes_thread_handles(monkeypatch, tmp_path):
+    """Test the archive handles opened by worker threads are closed with the archive"""
+    path = tmp_path / "companyfacts.zip"
+    with zipfile.ZipFile(path, "w") as archive:
+        for cik in range(3):
+            archive.writestr(f"CIK{cik:010}.json", json.dumps({"cik": cik}))
+    opened: list[zipfile.ZipFile] = []
+
+    class RecordingZipFile(zipfile.ZipFile):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            opened.append(self)
+
+    monkeypatch.setattr(bulk_archive.zipfile, "ZipFile", RecordingZipFile)
+    with BulkArchive(str(path)) as bulk:
+        members = bulk.company_members()
+        results = dict(map_concurrently(bulk.read, members, workers=3))
+    ciks = []
+    for result in results.values():
+        assert result is not None
+        ciks.append(result["data"]["cik"])
+    assert sorted(ciks) == [0, 1, 2]
+    assert len(opened) > 1 and all(handle.fp is None for handle in opened)
+
+
+def test_load_bulk_submissions(tmp_path):
+    """Test filings, including extra submissions files, are loaded from submissions.zip"""
+    CompanyFactory(CIK=1111111, name="Fake.ai")
+    main = {
+        "cik": "1111111",
+        "filings": {
+            "recent": submissions_data(["0001111111-21-000001"]),
+            "files": [{"name": "CIK0001111111-submissions-001.json"}],
+        },
+    }
+    path = tmp_path / "submissions.zip"
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("CIK0001111111.json", json.dumps(main))
+        archive.writestr(
+            "CIK0001111111-submissions-001.json",
+            json.dumps(submissions_data(["0001111111-11-000001"])),
+        )
+    call_command("load_bulk_submissions", str(path))
+    assert set(Filing.objects.values_list("accn_num", flat=True)) == {
+        "0001111111-21-000001",
+        "0001111111-11-000001",
+    }
+
+
+def test_load_submissions_skips_saved_extra_files():
+    """Test extra submissions files are fetched concurrently and only once"""
+    company = CompanyFactory(CIK=1111111, name="Fake.ai")
+    files = [
+        {"name": f"CIK0001111111-submissions-00{i}.json", "filingCount": 1}
+        for i in range(1, 4)
+    ]
+    extra = {
+        f["name"]: {"data": submissions_data([f"0001111111-1{i}-000001"])}
+        for i, f in enumerate(files)
+    }
+    fetched = []
+
+    def fetch_file(name):
+        fetched.append(name)
+        return extra[name]
+
+    def response(checksum, files):
+        data = {
+            "cik": company.CIK,
+            "filings": {"recent": submissions_data([]), "files": files},
+        }
+        return {"data": data, "checksum": checksum}
+
+    save_submissions_response(
+        response("a", files[:2]), fetch_file=fetch_file, workers=2
+    )
+    assert sorted(fetched) == [f["name"] for f in files[:2]]
+    fetched.clear()
+    save_submissions_response(response("b", files), fetch_file=fetch_file, workers=2)
+    assert fetched == [files[2]["name"]]
+    assert Filing.objects.count() == 3
+    assert company.submission_files.count() == 3
+
+
+def test_load_submissions_retries_failed_extra_files():
+    """Test an extra submissions file that failed is fetched again by the next run"""
+    company = CompanyFactory(CIK=1111111, name="Fake.ai")
+    files = [
+        {"name": f"CIK0001111111-submissions-00{i}.json", "filingCount": 1}
+        for i in range(1, 3)
+    ]
+    extra = {
+        f["name"]: {"data": submissions_data([f"0001111111-1{i}-000001"])}
+        for i, f in enumerate(files)
+    }
+    broken = {files[1]["name"]}
+    fetched = []
+
+    def fetch_file(name):
+        fetched.append(name)
+        return None if name in broken else extra[name]
+
+    response = {
+        "data": {
+            "cik": company.CIK,
+            "filings": {"recent": submissions_data([]), "files": files},
+        },
+        "checksum": "checksum",
+        "etag": '"abc"',
+    }
+    save_submissions_response(response, fetch_file=fetch_file)
+    assert Filing.objects.count() == 1
+    checksum = Checksum.objects.get(company=company)
+    assert (checksum.checksum, checksum.etag) == ("", "")
+    broken.clear()
+    fetched.clear()
+    save_submissions_response(response, fetch_file=fetch_file)
+    assert fetched == [files[1]["name"]]
+    assert Filing.objects.count() == 2
+    assert Checksum.objects.get(company=company).checksum == "checksum"
+
+
+def test_load_submissions_stops_at_watermark():
+    """Test only the filings newer than the company's watermark are scanned"""
+    company = CompanyFactory(CIK=1111111, submissions_watermark_accn="0001111111-21-2")
+    recent = submissions_data(["0001111111-22-3", "0001111111-21-2", "0001111111-20-1"])
+    recent["filingDate"] = ["2022-01-01", "2021-01-01", "2020-01-01"]
+    response = {
+        "data": {"cik": company.CIK, "filings": {"recent": recent, "files": []}},
+        "checksum": "checksum",
+    }
+    save_submissions_response(response)
+    assert list(Filing.objects.values_list("accn_num", flat=True)) == [
+        "0001111111-22-3"
+    ]
+    company.refresh_from_db()
+    assert company.submissions_watermark_accn == "0001111111-22-3"
+    assert company.submissions_watermark_date == date(2022, 1, 1)
+
+    save_submissions_response(response, force=True)
+    assert Filing.objects.count() == 3